@@ -0,0 +1,418 @@
+import argparse
+import json
+import platform
+import sys
+import threading
+import time
+import numpy as np
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from aimakerspace.indexes import IVFIndex, VectorIndex
+from aimakerspace.vectordatabase import DISTANCE_METRICS, VectorDatabase
+
+
+def synthetic_embeddings(n: int, dim: int, n_clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """
+    Generate clustered unit-length float32 vectors that look roughly like text embeddings.
+
+    Points are drawn around random cluster centres so that nearest-neighbour structure
+    (and therefore approximate-index recall) is non-trivial.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+    vectors = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 65536):
+        stop = min(start + 65536, n)
+        labels = rng.integers(0, n_clusters, stop - start)
+        vectors[start:stop] = centres[labels] + 0.75 * rng.standard_normal((stop - start, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def _latencies(run: Callable[[np.ndarray], Any], queries: np.ndarray, warmup: int = 3) -> np.ndarray:
+    for query in queries[:warmup]:
+        run(query)
+    latencies = np.empty(len(queries))
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        run(query)
+        latencies[i] = time.perf_counter() - start
+    return latencies
+
+
+def benchmark_sharding(
+    n_vectors: int = 200_000,
+    dim: int = 1536,
+    shard_counts: Sequence[int] = (1, 2, 4, 8),
+    n_queries: int = 50,
+    k: int = 10,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Measure exact-search latency of one store at several shard counts.
+
+    :return: One result dict per shard count with p50/p99/mean latency (ms), queries per
+        second and the speedup of the mean latency over a single shard
+    """
+    vectors = synthetic_embeddings(n_vectors, dim, seed=seed)
+    queries = synthetic_embeddings(n_queries, dim, seed=seed + 1)
+    db = VectorDatabase(initial_capacity=n_vectors)
+    db.insert_many([f"doc-{i}" for i in range(n_vectors)], vectors)
+
+    results = []
+    baseline = None
+    for n_shards in shard_counts:
+        db.n_shards = n_shards
+        latencies = _latencies(lambda query: db.search(query, k, exact=True), queries)
+        mean = float(latencies.mean())
+        baseline = baseline or mean
+        results.append({
+            "benchmark": "sharding",
+            "n_vectors": n_vectors,
+            "dim": dim,
+            "n_shards": n_shards,
+            "p50_ms": float(np.percentile(latencies, 50) * 1e3),
+            "p99_ms": float(np.percentile(latencies, 99) * 1e3),
+            "mean_ms": mean * 1e3,
+            "qps": 1.0 / mean,
+            "speedup": baseline / mean,
+        })
+    return results
+
+
+# Each configuration attaches at most one index and one quantizer; ``max_vectors`` skips
+# sizes a structure cannot build in reasonable time (HNSW is pure Python).
+DEFAULT_CONFIGURATIONS: Tuple[Dict[str, Any], ...] = (
+    {"name": "exact"},
+    {"name": "ivf", "index": "ivf"},
+    {"name": "hnsw", "index": "hnsw", "max_vectors": 10_000},
+    {"name": "int8", "quantization": "int8"},
+    {"name": "pq", "quantization": "pq"},
+)
+
+# Synthetic chunks carry {"source": "doc-<i % 100>", "page": i % 500}, so these select
+# roughly 100%, 1% and 20% of the store.
+DEFAULT_FILTERS: Dict[str, Optional[Dict[str, Any]]] = {
+    "none": None,
+    "equality": {"source": "doc-7"},
+    "range": {"page": {"$gte": 100, "$lt": 200}},
+}
+
+
+def _synthetic_metadata(start: int, stop: int) -> List[Dict[str, Any]]:
+    return [{"source": f"doc-{i % 100}", "page": i % 500} for i in range(start, stop)]
+
+
+def _recall(results: List[List[str]], truth: List[List[str]]) -> float:
+    hits = sum(len(set(found) & set(expected)) for found, expected in zip(results, truth))
+    total = sum(len(expected) for expected in truth)
+    return hits / total if total else 1.0
+
+
+def benchmark_retrieval(
+    sizes: Sequence[int] = (10_000, 100_000, 1_000_000),
+    dim: int = 128,
+    configurations: Sequence[Dict[str, Any]] = DEFAULT_CONFIGURATIONS,
+    metrics: Sequence[str] = ("cosine", "euclidean"),
+    filters: Optional[Dict[str, Optional[Dict[str, Any]]]] = None,
+    n_queries: int = 100,
+    k: int = 10,
+    batch_size: int = 10_000,
+    seed: int = 0,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Offline retrieval benchmark over synthetic embeddings at several store sizes.
+
+    For every size the store is filled in batches (insert throughput), then each
+    configuration's index/quantizer is built (build time, memory footprint) and
+    queried for every metric and filter: latency percentiles and recall@k against
+    exact search with the same metric and filter. Queries are perturbed copies of
+    stored vectors, so they fall inside the data distribution.
+
+    :param configurations: Dicts with ``name`` and optional ``index``, ``quantization``,
+        ``search_params`` and ``max_vectors``
+    :param filters: Named metadata filters; defaults to :data:`DEFAULT_FILTERS`
+    :param progress: Called with each result as soon as it is measured
+    :return: One flat, JSON-serialisable result dict per (size, configuration, metric, filter)
+    """
+    filters = DEFAULT_FILTERS if filters is None else filters
+    environment = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+    }
+    results = []
+    for n_vectors in sizes:
+        vectors = synthetic_embeddings(n_vectors, dim, seed=seed)
+        rng = np.random.default_rng(seed + 1)
+        queries = vectors[rng.integers(0, n_vectors, n_queries)]
+        queries = queries + 0.05 * rng.standard_normal(queries.shape, dtype=np.float32)
+
+        db = VectorDatabase(initial_capacity=n_vectors)
+        start = time.perf_counter()
+        for batch in range(0, n_vectors, batch_size):
+            stop = min(batch + batch_size, n_vectors)
+            db.insert_many([f"chunk-{i}" for i in range(batch, stop)], vectors[batch:stop], _synthetic_metadata(batch, stop))
+        insert_seconds = time.perf_counter() - start
+        del vectors
+
+        selectivity = {
+            name: (len(db.filter_by_metadata(criteria)) / n_vectors if criteria else 1.0)
+            for name, criteria in filters.items()
+        }
+        truth: Dict[Tuple[str, str], List[List[str]]] = {}
+        for configuration in configurations:
+            if n_vectors > configuration.get("max_vectors", n_vectors):
+                continue
+            start = time.perf_counter()
+            db.build_index(configuration.get("index"))
+            db.build_quantizer(configuration.get("quantization"))
+            build_seconds = time.perf_counter() - start
+            memory_bytes = db.stats()["bytes"]["total"]
+            search_params = configuration.get("search_params", {})
+
+            for metric in metrics:
+                distance_measure = DISTANCE_METRICS[metric]
+                for filter_name, criteria in filters.items():
+                    if (metric, filter_name) not in truth:
+                        truth[(metric, filter_name)] = [
+                            [key for key, _, _ in db.search(query, k, distance_measure, criteria, exact=True)]
+                            for query in queries
+                        ]
+                    found: List[List[str]] = []
+
+                    def run(query: np.ndarray) -> None:
+                        found.append([key for key, _, _ in db.search(query, k, distance_measure, criteria, **search_params)])
+
+                    latencies = _latencies(run, queries)
+                    result = {
+                        "benchmark": "retrieval",
+                        "n_vectors": n_vectors,
+                        "dim": dim,
+                        "configuration": configuration["name"],
+                        "index": configuration.get("index") or "exact",
+                        "quantization": configuration.get("quantization") or "none",
+                        "metric": metric,
+                        "filter": filter_name,
+                        "filter_selectivity": selectivity[filter_name],
+                        "k": k,
+                        "n_queries": n_queries,
+                        "insert_vectors_per_s": n_vectors / insert_seconds,
+                        "build_s": build_seconds,
+                        "p50_ms": float(np.percentile(latencies, 50) * 1e3),
+                        "p99_ms": float(np.percentile(latencies, 99) * 1e3),
+                        "mean_ms": float(latencies.mean() * 1e3),
+                        "qps": float(1.0 / latencies.mean()),
+                        # The warm-up queries run first, so the timed results are the last n_queries.
+                        "recall_at_k": _recall(found[-n_queries:], truth[(metric, filter_name)]),
+                        "memory_bytes": memory_bytes,
+                        "bytes_per_vector": memory_bytes / n_vectors,
+                        **environment,
+                    }
+                    results.append(result)
+                    if progress is not None:
+                        progress(result)
+        del db
+    return results
+
+
+def _key_vector(key: str, generation: int, dim: int) -> np.ndarray:
+    """Deterministic vector for one write of ``key`` so readers can verify what they get back."""
+    seed = int(key.rsplit("-", 1)[1]) * 1_000_003 + generation
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def stress_test_concurrency(
+    n_keys: int = 2000,
+    dim: int = 64,
+    n_readers: int = 4,
+    n_writers: int = 2,
+    duration: float = 5.0,
+    k: int = 10,
+    index: Optional[Union[str, VectorIndex]] = None,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Hammer one store with concurrent searches, inserts, deletes and compactions.
+
+    Every write of key ``doc-i`` stores a vector derived from ``(i, generation)`` and
+    records the generation in the metadata, so each search result can be checked
+    against the vector it claims to come from. Writers own disjoint key ranges.
+
+    :return: Counts of operations performed and the number of inconsistencies seen
+    :raises AssertionError: If any thread raised or any result was inconsistent
+    """
+    db = VectorDatabase(initial_capacity=256, index=index)
+    keys = [f"doc-{i}" for i in range(n_keys)]
+    db.insert_many(
+        keys,
+        np.stack([_key_vector(key, 0, dim) for key in keys]),
+        [{"generation": 0, "writer": i % n_writers} for i in range(n_keys)],
+    )
+
+    stop = threading.Event()
+    errors: List[str] = []
+    counts = {"searches": 0, "writes": 0, "deletes": 0, "compactions": 0}
+    live = [dict.fromkeys(keys[w::n_writers], 0) for w in range(n_writers)]
+
+    def check_results(query: np.ndarray, results: List[Tuple[str, float, Dict[str, Any]]]) -> None:
+        found = [key for key, _, _ in results]
+        if len(found) != len(set(found)):
+            errors.append(f"duplicate keys in results: {found}")
+        scores = [score for _, score, _ in results]
+        if any(a < b for a, b in zip(scores, scores[1:])):
+            errors.append(f"results not sorted: {scores}")
+        for key, score, metadata in results:
+            # The metadata returned with a result belongs to the exact row that was scored.
+            vector = _key_vector(key, metadata["generation"], dim)
+            expected = float(vector @ query / (np.linalg.norm(vector) * np.linalg.norm(query)))
+            if abs(expected - score) > 1e-4:
+                errors.append(f"{key}: score {score} does not match its vector ({expected})")
+
+    def reader(reader_id: int) -> None:
+        rng = np.random.default_rng(seed + 100 + reader_id)
+        try:
+            while not stop.is_set():
+                query = rng.standard_normal(dim).astype(np.float32)
+                check_results(query, db.search(query, k))
+                writer_id = int(rng.integers(n_writers))
+                for key, _, metadata in db.search(query, k, metadata_filter={"writer": writer_id}):
+                    if metadata.get("writer") != writer_id:
+                        errors.append(f"{key} does not match filter writer={writer_id}: {metadata}")
+                key = keys[int(rng.integers(n_keys))]
+                vector, metadata = db.retrieve_from_key(key)
+                if vector is not None and not np.allclose(vector, _key_vector(key, metadata["generation"], dim), atol=1e-5):
+                    errors.append(f"{key}: retrieved vector does not match generation {metadata['generation']}")
+                counts["searches"] += 1
+        except Exception as exc:  # pragma: no cover - reported through ``errors``
+            errors.append(f"reader {reader_id}: {exc!r}")
+
+    def writer(writer_id: int) -> None:
+        rng = np.random.default_rng(seed + 200 + writer_id)
+        owned = live[writer_id]
+        names = list(owned)
+        try:
+            while not stop.is_set():
+                key = names[int(rng.integers(len(names)))]
+                if key in owned and rng.random() < 0.3:
+                    db.delete(key)
+                    del owned[key]
+                    counts["deletes"] += 1
+                else:
+                    generation = owned.get(key, 0) + 1
+                    metadata = {"generation": generation, "writer": writer_id}
+                    db.upsert(key, _key_vector(key, generation, dim), metadata)
+                    owned[key] = generation
+                    counts["writes"] += 1
+        except Exception as exc:  # pragma: no cover - reported through ``errors``
+            errors.append(f"writer {writer_id}: {exc!r}")
+
+    def compactor() -> None:
+        try:
+            while not stop.wait(0.2):
+                db.compact()
+                counts["compactions"] += 1
+        except Exception as exc:  # pragma: no cover - reported through ``errors``
+            errors.append(f"compactor: {exc!r}")
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(n_readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(n_writers)]
+    threads.append(threading.Thread(target=compactor))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    expected = {key: generation for owned in live for key, generation in owned.items()}
+    if len(db) != len(expected):
+        errors.append(f"database holds {len(db)} keys, expected {len(expected)}")
+    for key, generation in expected.items():
+        vector, metadata = db.retrieve_from_key(key)
+        if vector is None or metadata.get("generation") != generation:
+            errors.append(f"{key}: expected generation {generation}, found {metadata}")
+        elif not np.allclose(vector, _key_vector(key, generation, dim), atol=1e-5):
+            errors.append(f"{key}: stored vector does not match generation {generation}")
+
+    assert not errors, f"{len(errors)} concurrency errors, first: {errors[0]}"
+    return {"benchmark": "concurrency", "index": db.index.name if db.index else "exact", "keys": len(db), **counts}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark VectorDatabase sharded exact search")
+    parser.add_argument(
+        "--suite",
+        action="store_true",
+        help="Run the retrieval benchmark suite (sizes x configurations x metrics x filters) instead",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument(
+        "--configurations",
+        nargs="+",
+        choices=[configuration["name"] for configuration in DEFAULT_CONFIGURATIONS],
+        help="Subset of the suite's configurations to run (default: all)",
+    )
+    parser.add_argument("--metrics", nargs="+", default=["cosine", "euclidean"], choices=list(DISTANCE_METRICS))
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", help="With --suite, also write the results as JSON lines to this file")
+    parser.add_argument("--n-vectors", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, help="Embedding dimension (default: 1536, or 128 with --suite)")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--stress", type=float, metavar="SECONDS", help="Run the concurrency stress test instead")
+    parser.add_argument("--json", action="store_true", help="Emit one JSON object per line")
+    args = parser.parse_args()
+
+    if args.suite:
+        configurations = [
+            configuration
+            for configuration in DEFAULT_CONFIGURATIONS
+            if not args.configurations or configuration["name"] in args.configurations
+        ]
+        output = open(args.output, "w", encoding="utf-8") if args.output else None
+
+        def report(result: Dict[str, Any]) -> None:
+            if output is not None:
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(
+                    f"n={result['n_vectors']:>8}  {result['configuration']:<6} {result['metric']:<10} "
+                    f"{result['filter']:<9} p50={result['p50_ms']:8.2f} ms  p99={result['p99_ms']:8.2f} ms  "
+                    f"recall@{result['k']}={result['recall_at_k']:.3f}  build={result['build_s']:7.2f} s  "
+                    f"insert={result['insert_vectors_per_s']:9.0f}/s  mem={result['memory_bytes'] / 2**20:8.1f} MiB",
+                    file=sys.stdout,
+                )
+
+        benchmark_retrieval(
+            args.sizes,
+            args.dim or 128,
+            configurations,
+            args.metrics,
+            n_queries=args.queries,
+            k=args.k,
+            progress=report,
+        )
+        if output is not None:
+            output.close()
+        raise SystemExit(0)
+
+    if args.stress:
+        # The IVF index trains early so the store is indexed for most of the run.
+        for index in (None, IVFIndex(n_lists=32, min_train_size=256), "hnsw"):
+            result = stress_test_concurrency(duration=args.stress, index=index)
+            print(json.dumps(result) if args.json else result)
+        raise SystemExit(0)
+
+    for result in benchmark_sharding(args.n_vectors, args.dim or 1536, args.shards, args.queries):
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(
+                f"shards={result['n_shards']:>3}  p50={result['p50_ms']:8.2f} ms  "
+                f"p99={result['p99_ms']:8.2f} ms  qps={result['qps']:8.1f}  speedup={result['speedup']:.2f}x"
+            )
@@ -0,0 +1,131 @@
+import copy
+import math
+import re
+import numpy as np
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens; numbers and form ids such as ``1098-E`` keep their parts."""
+    return _TOKEN.findall(text.lower())
+
+
+class _Posting:
+    """Growable (row, term frequency) arrays for one term; ``size`` is bumped after the entries are written."""
+
+    __slots__ = ("rows", "tfs", "size")
+
+    def __init__(self):
+        self.rows = np.zeros(4, dtype=np.intp)
+        self.tfs = np.zeros(4, dtype=np.float32)
+        self.size = 0
+
+    def append(self, row: int, tf: int) -> None:
+        size = self.size
+        if size == self.rows.shape[0]:
+            rows = np.zeros(2 * size, dtype=np.intp)
+            rows[:size] = self.rows
+            tfs = np.zeros(2 * size, dtype=np.float32)
+            tfs[:size] = self.tfs
+            self.rows, self.tfs = rows, tfs
+        self.rows[size] = row
+        self.tfs[size] = tf
+        self.size = size + 1
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over the texts of a VectorDatabase's rows.
+
+    Like the vector indexes it is row-aligned and append-only: rows are added as
+    the database writes them, deleted rows stop counting towards the corpus
+    statistics immediately and are skipped by the database at query time, and
+    compaction rebuilds the postings over the surviving rows.
+    """
+
+    name = "bm25"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        :param k1: Term-frequency saturation
+        :param b: Strength of document-length normalisation (0 disables it)
+        """
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, _Posting] = {}
+        self._document_frequency: Counter = Counter()
+        self._lengths = np.zeros(1024, dtype=np.float32)
+        self._n_documents = 0
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return self._n_documents
+
+    def add(self, rows: Sequence[int], texts: Sequence[str]) -> None:
+        """Index ``texts`` as the documents of ``rows``."""
+        for row, text in zip(rows, texts):
+            counts = Counter(tokenize(text))
+            if row >= self._lengths.shape[0]:
+                lengths = np.zeros(max(row + 1, 2 * self._lengths.shape[0]), dtype=np.float32)
+                lengths[: self._lengths.shape[0]] = self._lengths
+                self._lengths = lengths
+            length = sum(counts.values())
+            self._lengths[row] = length
+            for term, tf in counts.items():
+                posting = self._postings.get(term)
+                if posting is None:
+                    posting = self._postings[term] = _Posting()
+                posting.append(row, tf)
+                self._document_frequency[term] += 1
+            self._n_documents += 1
+            self._total_length += length
+
+    def remove(self, row: int, text: str) -> None:
+        """Stop counting ``row`` (holding ``text``) in the corpus statistics; its postings stay until compaction."""
+        for term in set(tokenize(text)):
+            self._document_frequency[term] -= 1
+        self._n_documents -= 1
+        self._total_length -= int(self._lengths[row])
+
+    def compacted(self, texts: Sequence[str]) -> "BM25Index":
+        """Return a fresh index over ``texts`` (the compacted rows, in order) with the same parameters."""
+        clone = copy.copy(self)
+        BM25Index.__init__(clone, self.k1, self.b)
+        clone.add(range(len(texts)), texts)
+        return clone
+
+    def score(self, query: str, size: int, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 scores of every row below ``size`` that contains a query term.
+
+        :param rows: Optional sorted rows to restrict scoring to (e.g. a metadata filter)
+        :return: (rows, scores) for the matching rows, rows sorted ascending
+        """
+        n_documents = max(1, self._n_documents)
+        average_length = self._total_length / n_documents or 1.0
+        lengths = self._lengths
+        matched_rows, contributions = [], []
+        for term, query_tf in Counter(tokenize(query)).items():
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            count = posting.size
+            term_rows, tfs = posting.rows[:count], posting.tfs[:count]
+            keep = term_rows < size
+            if rows is not None:
+                keep &= np.isin(term_rows, rows, assume_unique=True)
+            term_rows, tfs = term_rows[keep], tfs[keep]
+            if term_rows.size == 0:
+                continue
+            df = max(0, self._document_frequency[term])
+            idf = math.log(1.0 + (n_documents - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * lengths[term_rows] / average_length)
+            matched_rows.append(term_rows)
+            contributions.append(query_tf * idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+        if not matched_rows:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+        unique_rows, inverse = np.unique(np.concatenate(matched_rows), return_inverse=True)
+        return unique_rows, np.bincount(inverse, weights=np.concatenate(contributions)).astype(np.float32)
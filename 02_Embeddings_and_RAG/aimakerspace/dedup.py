@@ -0,0 +1,188 @@
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from aimakerspace.openai_utils.batching import EmbeddingBatchScheduler, pack_batches, token_counter
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_SHINGLE_BASE = np.uint64(257)
+
+
+@dataclass
+class DedupReport:
+    """What an ingest-time deduplication pass removed and what that saved."""
+
+    n_input: int
+    n_kept: int
+    n_duplicates: int
+    text_bytes_saved: int
+    requests_saved: int
+    vector_bytes_saved: int = 0
+    duplicate_of: Dict[int, int] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "n_input": self.n_input,
+            "n_kept": self.n_kept,
+            "n_duplicates": self.n_duplicates,
+            "embedding_inputs_saved": self.n_duplicates,
+            "requests_saved": self.requests_saved,
+            "text_bytes_saved": self.text_bytes_saved,
+            "vector_bytes_saved": self.vector_bytes_saved,
+        }
+
+
+class MinHashDeduplicator:
+    """
+    Near-duplicate detection for text chunks with MinHash signatures and LSH banding.
+
+    Each chunk is reduced to the set of hashed character shingles of its normalised
+    text, and ``num_perm`` MinHash values estimate the Jaccard similarity of two such
+    sets. Signatures are split into bands; chunks sharing any band bucket become
+    candidate pairs, and a candidate is a duplicate when its estimated similarity to
+    an earlier kept chunk reaches ``threshold``. The first occurrence always wins.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        num_perm: int = 128,
+        shingle_size: int = 5,
+        seed: int = 0,
+    ):
+        """
+        :param threshold: Estimated Jaccard similarity at which chunks count as duplicates
+        :param num_perm: MinHash functions per signature (more is more accurate)
+        :param shingle_size: Characters per shingle
+        :param seed: Seed for the hash permutations
+        """
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # Universal hashing (a * h + b) mod p; the product wraps modulo 2^64 as in the usual
+        # MinHash implementations, which keeps the permutations well mixed.
+        self._a = rng.integers(1, int(_MERSENNE_PRIME), num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_MERSENNE_PRIME), num_perm, dtype=np.uint64)
+        self.bands, self.rows_per_band = self._banding(threshold, num_perm)
+
+    @staticmethod
+    def _banding(threshold: float, num_perm: int) -> Tuple[int, int]:
+        """Pick (bands, rows) with bands * rows <= num_perm whose S-curve midpoint is nearest ``threshold``."""
+        best = None
+        for rows in range(1, num_perm + 1):
+            bands = num_perm // rows
+            midpoint = (1.0 / bands) ** (1.0 / rows)
+            if best is None or abs(midpoint - threshold) < best[0]:
+                best = (abs(midpoint - threshold), bands, rows)
+        return best[1], best[2]
+
+    def _shingles(self, text: str) -> np.ndarray:
+        data = np.frombuffer(" ".join(text.lower().split()).encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+        if data.size == 0:
+            return np.zeros(1, dtype=np.uint64)
+        width = min(self.shingle_size, data.size)
+        hashes = np.zeros(data.size - width + 1, dtype=np.uint64)
+        for offset in range(width):
+            # Polynomial rolling hash of every window at once, reduced to 32 bits.
+            hashes = (hashes * _SHINGLE_BASE + data[offset : offset + hashes.size]) & np.uint64(0xFFFFFFFF)
+        return np.unique(hashes)
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature (``num_perm`` values) of ``text``."""
+        shingles = self._shingles(text)
+        with np.errstate(over="ignore"):
+            permuted = (np.outer(shingles, self._a) + self._b) % _MERSENNE_PRIME
+        return (permuted & np.uint64(0xFFFFFFFF)).min(axis=0)
+
+    def find_duplicates(self, texts: List[str]) -> Dict[int, int]:
+        """Map the index of every near-duplicate in ``texts`` to the index of the earlier chunk it repeats."""
+        signatures = np.stack([self.signature(text) for text in texts]) if texts else np.zeros((0, self.num_perm))
+        buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        duplicate_of: Dict[int, int] = {}
+        for i in range(len(texts)):
+            candidates = set()
+            for band in range(self.bands):
+                start = band * self.rows_per_band
+                key = signatures[i, start : start + self.rows_per_band].tobytes()
+                members = buckets[band].setdefault(key, [])
+                candidates.update(members)
+                members.append(i)
+            best, best_similarity = None, self.threshold
+            for j in sorted(candidates):
+                similarity = float(np.mean(signatures[i] == signatures[j]))
+                if similarity >= best_similarity:
+                    best, best_similarity = j, similarity
+            if best is not None:
+                duplicate_of[i] = duplicate_of.get(best, best)
+        return duplicate_of
+
+    def deduplicate(
+        self,
+        texts_with_metadata: List[Tuple[str, Dict[str, Any]]],
+        mode: str = "drop",
+        scheduler: Optional[EmbeddingBatchScheduler] = None,
+        model_name: str = "text-embedding-3-small",
+    ) -> Tuple[List[Tuple[str, Dict[str, Any]]], DedupReport]:
+        """
+        Remove near-duplicate chunks before they are embedded.
+
+        :param mode: "drop" discards duplicates; "merge" also records each duplicate's
+            metadata under the kept chunk's ``"duplicates"`` key
+        :param scheduler: Scheduler whose request limits the embedding calls will be packed
+            under, used to report requests saved; defaults to :class:`EmbeddingBatchScheduler`
+        :param model_name: Embedding model whose tokenizer sizes the inputs
+        :return: The surviving ``(text, metadata)`` pairs in order and a report
+        """
+        if mode not in ("drop", "merge"):
+            raise ValueError(f"Unknown dedup mode: {mode}. Available: ['drop', 'merge']")
+        texts = [text for text, _ in texts_with_metadata]
+        duplicate_of = self.find_duplicates(texts)
+
+        kept: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+        for i, (text, metadata) in enumerate(texts_with_metadata):
+            if i not in duplicate_of:
+                kept[i] = (text, dict(metadata or {}) if mode == "merge" else metadata)
+            elif mode == "merge":
+                kept[duplicate_of[i]][1].setdefault("duplicates", []).append(dict(metadata or {}))
+
+        n_input, n_kept = len(texts), len(kept)
+        report = DedupReport(
+            n_input=n_input,
+            n_kept=n_kept,
+            n_duplicates=n_input - n_kept,
+            text_bytes_saved=sum(len(texts[i].encode("utf-8")) for i in duplicate_of),
+            requests_saved=self._requests_saved(texts, list(kept), scheduler, model_name),
+            duplicate_of=duplicate_of,
+        )
+        return list(kept.values()), report
+
+    @staticmethod
+    def _requests_saved(
+        texts: List[str],
+        kept: List[int],
+        scheduler: Optional[EmbeddingBatchScheduler],
+        model_name: str,
+    ) -> int:
+        """Requests the scheduler would plan for ``texts`` minus those it would plan for the ``kept`` ones."""
+        scheduler = scheduler or EmbeddingBatchScheduler()
+        count, _ = token_counter(model_name)
+        token_counts = count(texts) if texts else []
+        # Pack the way EmbeddingBatchScheduler.plan does, without its per-input limit check.
+        limits = (scheduler.max_tokens_per_request, scheduler.max_inputs_per_request)
+        before = pack_batches(token_counts, *limits)
+        after = pack_batches([token_counts[i] for i in kept], *limits)
+        return len(before) - len(after)
+
+
+def deduplicate_texts(
+    texts_with_metadata: List[Tuple[str, Dict[str, Any]]],
+    threshold: float = 0.85,
+    mode: str = "drop",
+    deduplicator: Optional[MinHashDeduplicator] = None,
+) -> Tuple[List[Tuple[str, Dict[str, Any]]], DedupReport]:
+    """Convenience wrapper around :meth:`MinHashDeduplicator.deduplicate`."""
+    deduplicator = deduplicator or MinHashDeduplicator(threshold=threshold)
+    return deduplicator.deduplicate(texts_with_metadata, mode=mode)
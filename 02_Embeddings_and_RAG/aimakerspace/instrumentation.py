@@ -0,0 +1,227 @@
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from itertools import accumulate
+from typing import IO, Any, Callable, Dict, Iterator, Tuple, Union
+
+# A sink receives (event name, duration in seconds, attributes) for every timed stage.
+Sink = Callable[[str, float, Dict[str, Any]], None]
+
+# Events emitted by the instrumented code.
+EVENTS = (
+    "embedding.get_embedding",
+    "embedding.get_embeddings",
+    "embedding.async_get_embedding",
+    "embedding.async_get_embeddings",
+    "vectordb.search",
+    "vectordb.search.filter",
+    "vectordb.search.candidates",
+    "vectordb.search.score",
+    "vectordb.search.select",
+    "chat.run",
+)
+
+# Instrumented code checks this flag before reading the clock, so with no sink attached
+# the hot paths pay one attribute lookup and nothing else.
+enabled = False
+_sinks: Tuple[Sink, ...] = ()
+_sinks_lock = threading.Lock()
+
+
+def add_sink(sink: Sink) -> Sink:
+    """Start sending timings to ``sink`` (a HistogramSink, JSONLinesSink or any callable) and return it."""
+    global enabled, _sinks
+    with _sinks_lock:
+        _sinks = _sinks + (sink,)
+        enabled = True
+    return sink
+
+
+def remove_sink(sink: Sink) -> None:
+    """Stop sending timings to ``sink``; instrumentation switches off with the last sink."""
+    global enabled, _sinks
+    with _sinks_lock:
+        _sinks = tuple(existing for existing in _sinks if existing is not sink)
+        enabled = bool(_sinks)
+
+
+def clear_sinks() -> None:
+    global enabled, _sinks
+    with _sinks_lock:
+        _sinks = ()
+        enabled = False
+
+
+@contextmanager
+def recording(sink: Sink) -> Iterator[Sink]:
+    """Attach ``sink`` for the duration of a ``with`` block."""
+    add_sink(sink)
+    try:
+        yield sink
+    finally:
+        remove_sink(sink)
+
+
+def record(name: str, seconds: float, **attributes: Any) -> None:
+    """Send one measurement to every sink."""
+    for sink in _sinks:
+        sink(name, seconds, attributes)
+
+
+def lap(name: str, started: float, **attributes: Any) -> float:
+    """Record the time since ``started`` under ``name`` and return the current clock, for timing consecutive stages."""
+    now = time.perf_counter()
+    record(name, now - started, **attributes)
+    return now
+
+
+class _Span:
+    __slots__ = ("name", "attributes", "started")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes: Any) -> None:
+        """Attach attributes discovered while the span runs (e.g. a cache hit or token usage)."""
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "_Span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        record(self.name, time.perf_counter() - self.started, **self.attributes)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attributes: Any) -> Union[_Span, _NoopSpan]:
+    """Context manager timing its block under ``name``; a shared no-op when instrumentation is off."""
+    if not enabled:
+        return _NOOP_SPAN
+    return _Span(name, attributes)
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram with constant memory.
+
+    Buckets are 2^(1/8) wide (about 9%) from 1 µs upwards, so percentiles are
+    reported to within one bucket; the exact minimum, maximum and mean are kept too.
+    """
+
+    _SMALLEST = 1e-6
+    _PER_DOUBLING = 8
+    _N_BUCKETS = 8 * 40
+
+    def __init__(self):
+        self.counts = [0] * self._N_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        if seconds <= self._SMALLEST:
+            bucket = 0
+        else:
+            bucket = min(self._N_BUCKETS - 1, math.ceil(math.log2(seconds / self._SMALLEST) * self._PER_DOUBLING))
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        """Upper bound (seconds) of the bucket holding the ``q``-th percentile."""
+        if self.count == 0:
+            return 0.0
+        target = max(1, math.ceil(q / 100.0 * self.count))
+        for bucket, cumulative in enumerate(accumulate(self.counts)):
+            if cumulative >= target:
+                upper = self._SMALLEST * 2 ** (bucket / self._PER_DOUBLING)
+                return min(max(upper, self.min), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1e3 if self.count else 0.0,
+            "min_ms": self.min * 1e3 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1e3,
+            "p90_ms": self.percentile(90) * 1e3,
+            "p99_ms": self.percentile(99) * 1e3,
+            "max_ms": self.max * 1e3,
+        }
+
+
+class HistogramSink:
+    """In-memory sink keeping one :class:`LatencyHistogram` per event name."""
+
+    def __init__(self):
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, name: str, seconds: float, attributes: Dict[str, Any]) -> None:
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.add(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Count, mean, min, p50/p90/p99 and max (milliseconds) per event name."""
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+
+
+class JSONLinesSink:
+    """Sink writing one JSON object per measurement: ``{"event", "ms", "time", **attributes}``."""
+
+    def __init__(self, file: Union[str, IO[str]]):
+        """
+        :param file: Path to append to, or an open text file (left open by :meth:`close`)
+        """
+        self._owns_file = isinstance(file, str)
+        self._file = open(file, "a", encoding="utf-8") if self._owns_file else file
+        self._lock = threading.Lock()
+
+    def __call__(self, name: str, seconds: float, attributes: Dict[str, Any]) -> None:
+        line = json.dumps({"event": name, "ms": seconds * 1e3, "time": time.time(), **attributes}, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def flush(self) -> None:
+        with self._lock:
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._owns_file:
+                self._file.close()
+            else:
+                self._file.flush()
+
@@ -0,0 +1,136 @@
+import numpy as np
+from collections import defaultdict
+from typing import Any, Dict, List
+
+
+def _is_hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+class _Posting:
+    """Growable sorted row array for one value; ``size`` is bumped after the row is written."""
+
+    __slots__ = ("rows", "size")
+
+    def __init__(self):
+        self.rows = np.zeros(4, dtype=np.intp)
+        self.size = 0
+
+    def append(self, row: int) -> None:
+        size = self.size
+        if size == self.rows.shape[0]:
+            rows = np.zeros(2 * size, dtype=np.intp)
+            rows[:size] = self.rows
+            self.rows = rows
+        self.rows[size] = row
+        self.size = size + 1
+
+    def view(self) -> np.ndarray:
+        # Read the size before the array: a grown array is published before the size that needs it.
+        size = self.size
+        return self.rows[:size]
+
+
+class MetadataIndex:
+    """
+    Per-field inverted index from metadata values to the storage rows that carry them.
+
+    Filters are resolved to a sorted array of candidate rows by intersecting posting
+    lists, so a filter costs time proportional to the rows it touches rather than to
+    the size of the store. The database writes rows in increasing order, so each
+    posting is a growable array that is sorted by construction and is read without
+    copying or re-sorting, even right after a write. Unhashable values (e.g. lists) cannot be posted and are
+    kept per field and compared directly, preserving ``==`` / ``in`` semantics.
+
+    Removing a row is O(1): its postings are left in place (the database drops
+    tombstoned rows from every filter result) and only a per-value count of live
+    rows is updated; compaction rebuilds the postings over the surviving rows.
+
+    One writer may mutate the index while other threads resolve filters: readers
+    never insert into the dictionaries and only see posting entries written before
+    the size that covers them.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[Any, _Posting]] = defaultdict(dict)
+        self._unindexed: Dict[str, Dict[int, Any]] = defaultdict(dict)
+        self._live_counts: Dict[str, Dict[Any, int]] = defaultdict(dict)
+
+    def add(self, row: int, metadata: Dict[str, Any]) -> None:
+        """Index ``metadata`` for ``row``."""
+        for field, value in metadata.items():
+            if _is_hashable(value):
+                postings = self._postings[field]
+                posting = postings.get(value)
+                if posting is None:
+                    posting = postings[value] = _Posting()
+                posting.append(row)
+                counts = self._live_counts[field]
+                counts[value] = counts.get(value, 0) + 1
+            else:
+                self._unindexed[field][row] = value
+
+    def remove(self, row: int, metadata: Dict[str, Any]) -> None:
+        """Stop counting ``row`` under the values in ``metadata``; its postings stay until compaction."""
+        for field, value in metadata.items():
+            if _is_hashable(value):
+                counts = self._live_counts[field]
+                remaining = counts.get(value, 0) - 1
+                if remaining > 0:
+                    counts[value] = remaining
+                else:
+                    counts.pop(value, None)
+            else:
+                self._unindexed[field].pop(row, None)
+
+    def _posting_array(self, field: str, value: Any) -> np.ndarray:
+        posting = self._postings.get(field, {}).get(value)
+        return posting.view() if posting is not None else np.empty(0, dtype=np.intp)
+
+    def rows_for(self, field: str, value: Any) -> np.ndarray:
+        """Sorted rows whose ``field`` equals ``value`` (or is one of ``value`` if it is a list)."""
+        options = value if isinstance(value, list) else [value]
+        parts = [self._posting_array(field, option) for option in options if _is_hashable(option)]
+        unindexed = self._unindexed.get(field)
+        if unindexed:
+            items = tuple(unindexed.items())
+            if isinstance(value, list):
+                matches = [row for row, item in items if item in value]
+            else:
+                matches = [row for row, item in items if item == value]
+            parts.append(np.sort(np.asarray(matches, dtype=np.intp)))
+        if not parts:
+            return np.empty(0, dtype=np.intp)
+        if len(parts) == 1:
+            return parts[0]
+        return np.unique(np.concatenate(parts))
+
+    def resolve(self, filter_criteria: Dict[str, Any]) -> np.ndarray:
+        """
+        Sorted rows matching every field of ``filter_criteria`` (equality or list membership).
+
+        Rows removed since the index was built may still be returned; the caller masks them.
+        """
+        candidates = sorted(
+            (self.rows_for(field, value) for field, value in filter_criteria.items()),
+            key=len,
+        )
+        rows = candidates[0]
+        for other in candidates[1:]:
+            if rows.size == 0:
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    def fields(self) -> List[str]:
+        """Names of every indexed metadata field."""
+        indexed = {field for field, counts in self._live_counts.items() if counts}
+        return sorted(indexed | {field for field, rows in self._unindexed.items() if rows})
+
+    def value_counts(self, field: str) -> Dict[Any, int]:
+        """Number of live rows per distinct (hashable) value of ``field``."""
+        return dict(self._live_counts.get(field, {}))
@@ -2,6 +2,8 @@ from openai import OpenAI
 from dotenv import load_dotenv
 import os
 
+from aimakerspace import instrumentation
+
 load_dotenv()
 
 
@@ -17,9 +19,13 @@ class ChatOpenAI:
             raise ValueError("messages must be a list")
 
         client = OpenAI()
-        response = client.chat.completions.create(
-            model=self.model_name, messages=messages, **kwargs
-        )
+        with instrumentation.span("chat.run", model=self.model_name, n_messages=len(messages)) as span:
+            response = client.chat.completions.create(
+                model=self.model_name, messages=messages, **kwargs
+            )
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
 
         if text_only:
             return response.choices[0].message.content
@@ -1,13 +1,41 @@
 from dotenv import load_dotenv
 from openai import AsyncOpenAI, OpenAI
 import openai
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 import os
 import asyncio
+import base64
+import numpy as np
+
+from aimakerspace import instrumentation
+from aimakerspace.openai_utils.batching import EmbeddingBatchError, EmbeddingBatchScheduler
+from aimakerspace.openai_utils.embedding_cache import EmbeddingStore, QueryEmbeddingCache
 
 
 class EmbeddingModel:
-    def __init__(self, embeddings_model_name: str = "text-embedding-3-small"):
+    def __init__(
+        self,
+        embeddings_model_name: str = "text-embedding-3-small",
+        query_cache: Optional[QueryEmbeddingCache] = None,
+        document_store: Optional[EmbeddingStore] = None,
+        dimensions: Optional[int] = None,
+        scheduler: Optional[EmbeddingBatchScheduler] = None,
+        encoding_format: str = "float",
+    ):
+        """
+        :param embeddings_model_name: OpenAI embedding model to call
+        :param query_cache: Optional cache consulted by ``get_embedding`` /
+            ``async_get_embedding`` before calling the API
+        :param document_store: Optional persistent store consulted by ``get_embeddings`` /
+            ``async_get_embeddings``; only texts it does not hold are sent to the API
+        :param dimensions: Optional reduced output size (text-embedding-3 models)
+        :param scheduler: Batching, concurrency, rate pacing and retries for ``async_get_embeddings``;
+            defaults to token-packed batches with at most 8 requests in flight
+        :param encoding_format: "float" or "base64"; with "base64" responses are decoded
+            straight into float32 arrays instead of lists of Python floats
+        """
+        if encoding_format not in ("float", "base64"):
+            raise ValueError(f"encoding_format must be 'float' or 'base64', got {encoding_format!r}")
         load_dotenv()
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.async_client = AsyncOpenAI()
@@ -19,43 +47,190 @@ class EmbeddingModel:
             )
         openai.api_key = self.openai_api_key
         self.embeddings_model_name = embeddings_model_name
+        self.query_cache = query_cache
+        self.document_store = document_store
+        self.dimensions = dimensions
+        self.scheduler = scheduler or EmbeddingBatchScheduler()
+        self.encoding_format = encoding_format
 
-    async def async_get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
-        batch_size = 1024
-        batches = [list_of_text[i:i + batch_size] for i in range(0, len(list_of_text), batch_size)]
-        
+    def _request_options(self) -> Dict[str, Any]:
+        options: Dict[str, Any] = {"model": self.embeddings_model_name}
+        if self.dimensions:
+            options["dimensions"] = self.dimensions
+        if self.encoding_format == "base64":
+            options["encoding_format"] = "base64"
+        return options
+
+    def _vectors(self, response) -> List:
+        """One embedding per input: float lists, or float32 rows decoded from base64 without Python floats."""
+        if self.encoding_format != "base64":
+            return [item.embedding for item in response.data]
+        matrix = None
+        for i, item in enumerate(response.data):
+            vector = np.frombuffer(base64.b64decode(item.embedding), dtype="<f4")
+            if matrix is None:
+                matrix = np.empty((len(response.data), vector.shape[0]), dtype=np.float32)
+            matrix[i] = vector
+        return list(matrix) if matrix is not None else []
+
+    def _matrix(self, vectors: List) -> np.ndarray:
+        if self.encoding_format == "base64" and vectors:
+            return np.stack(vectors)
+        return np.asarray(vectors, dtype=np.float32)
+
+    @property
+    def _cache_model(self) -> str:
+        """Model name the query cache keys entries by; reduced sizes get their own entries."""
+        if self.dimensions:
+            return f"{self.embeddings_model_name}:{self.dimensions}"
+        return self.embeddings_model_name
+
+    async def _async_embed(self, list_of_text: List[str]) -> List[List[float]]:
         async def process_batch(batch):
             embedding_response = await self.async_client.embeddings.create(
-                input=batch, model=self.embeddings_model_name
+                input=batch, **self._request_options()
             )
-            return [embeddings.embedding for embeddings in embedding_response.data]
-        
-        # Use asyncio.gather to process all batches concurrently
-        results = await asyncio.gather(*[process_batch(batch) for batch in batches])
-        
-        # Flatten the results
-        return [embedding for batch_result in results for embedding in batch_result]
+            return self._vectors(embedding_response)
+
+        # Batches are packed by token count and sent with bounded concurrency and pacing.
+        return await self.scheduler.run(list_of_text, process_batch, self.embeddings_model_name)
+
+    def _from_store(
+        self,
+        list_of_text: List[str],
+        stored: List[Optional[np.ndarray]],
+        missing: List[str],
+        fresh: List[List[float]],
+    ) -> np.ndarray:
+        """Assemble the (n, dim) result from stored vectors and freshly embedded ``missing`` texts."""
+        fresh_vectors = np.asarray(fresh, dtype=np.float32)
+        if missing:
+            self.document_store.put_many(self.embeddings_model_name, self.dimensions, missing, fresh_vectors)
+        if not list_of_text:
+            return np.zeros((0, self.dimensions or 0), dtype=np.float32)
+        by_text = dict(zip(missing, fresh_vectors))
+        dim = next(vector.shape[0] for vector in (*stored, *fresh_vectors) if vector is not None)
+        embeddings = np.empty((len(list_of_text), dim), dtype=np.float32)
+        for i, (text, vector) in enumerate(zip(list_of_text, stored)):
+            embeddings[i] = vector if vector is not None else by_text[text]
+        return embeddings
+
+    def _lookup_store(self, list_of_text: List[str]) -> Tuple[List[Optional[np.ndarray]], List[str]]:
+        stored = self.document_store.get_many(self.embeddings_model_name, self.dimensions, list_of_text)
+        # Repeated chunks are embedded once.
+        missing = list(dict.fromkeys(text for text, vector in zip(list_of_text, stored) if vector is None))
+        return stored, missing
+
+    async def async_get_embeddings_array(self, list_of_text: List[str]) -> np.ndarray:
+        """Embeddings of ``list_of_text`` as one (n, dim) float32 array, sending only store misses to the API."""
+        with instrumentation.span(
+            "embedding.async_get_embeddings", model=self.embeddings_model_name, n_texts=len(list_of_text)
+        ) as span:
+            if self.document_store is None:
+                return self._matrix(await self._async_embed(list_of_text))
+            stored, missing = self._lookup_store(list_of_text)
+            span.set(store_misses=len(missing))
+            try:
+                fresh = await self._async_embed(missing) if missing else []
+            except EmbeddingBatchError as error:
+                # Keep what did succeed, so that rerunning only sends the failed texts.
+                done = [i for i, vector in enumerate(error.results) if vector is not None]
+                if done:
+                    self.document_store.put_many(
+                        self.embeddings_model_name,
+                        self.dimensions,
+                        [missing[i] for i in done],
+                        np.asarray([error.results[i] for i in done], dtype=np.float32),
+                    )
+                raise self._caller_error(list_of_text, stored, missing, error) from error.__cause__
+            return self._from_store(list_of_text, stored, missing, fresh)
+
+    @staticmethod
+    def _caller_error(
+        list_of_text: List[str],
+        stored: List[Optional[np.ndarray]],
+        missing: List[str],
+        error: EmbeddingBatchError,
+    ) -> EmbeddingBatchError:
+        """Re-express an error about the store misses in terms of positions in ``list_of_text``."""
+        fresh = {
+            text: np.asarray(vector, dtype=np.float32)
+            for text, vector in zip(missing, error.results)
+            if vector is not None
+        }
+        failed = {missing[i]: failure for failure in error.failures for i in range(failure[0], failure[1])}
+        results = [vector if vector is not None else fresh.get(text) for text, vector in zip(list_of_text, stored)]
+        failures = []
+        for i, text in enumerate(list_of_text):
+            if stored[i] is not None or text not in failed:
+                continue
+            cause = failed[text][2]
+            if failures and failures[-1][1] == i and failures[-1][2] is cause:
+                failures[-1] = (failures[-1][0], i + 1, cause)
+            else:
+                failures.append((i, i + 1, cause))
+        return EmbeddingBatchError(results, failures)
+
+    async def async_get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
+        if self.document_store is not None or self.encoding_format == "base64":
+            return (await self.async_get_embeddings_array(list_of_text)).tolist()
+        with instrumentation.span(
+            "embedding.async_get_embeddings", model=self.embeddings_model_name, n_texts=len(list_of_text)
+        ):
+            return await self._async_embed(list_of_text)
 
     async def async_get_embedding(self, text: str) -> List[float]:
-        embedding = await self.async_client.embeddings.create(
-            input=text, model=self.embeddings_model_name
-        )
+        with instrumentation.span("embedding.async_get_embedding", model=self.embeddings_model_name) as span:
+            if self.query_cache is not None:
+                cached = self.query_cache.get(self._cache_model, text)
+                if cached is not None:
+                    span.set(cache_hit=True)
+                    return cached.tolist()
+
+            embedding = await self.async_client.embeddings.create(
+                input=text, **self._request_options()
+            )
 
-        return embedding.data[0].embedding
+        return self._single(text, embedding)
 
-    def get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
+    def _single(self, text: str, response) -> List[float]:
+        vector = self._vectors(response)[0]
+        if self.query_cache is not None:
+            self.query_cache.put(self._cache_model, text, vector)
+        return vector.tolist() if isinstance(vector, np.ndarray) else vector
+
+    def _embed(self, list_of_text: List[str]) -> List:
         embedding_response = self.client.embeddings.create(
-            input=list_of_text, model=self.embeddings_model_name
+            input=list_of_text, **self._request_options()
         )
 
-        return [embeddings.embedding for embeddings in embedding_response.data]
+        return self._vectors(embedding_response)
+
+    def get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
+        with instrumentation.span(
+            "embedding.get_embeddings", model=self.embeddings_model_name, n_texts=len(list_of_text)
+        ) as span:
+            if self.document_store is None:
+                vectors = self._embed(list_of_text)
+                return self._matrix(vectors).tolist() if self.encoding_format == "base64" else vectors
+            stored, missing = self._lookup_store(list_of_text)
+            span.set(store_misses=len(missing))
+            fresh = self._embed(missing) if missing else []
+            return self._from_store(list_of_text, stored, missing, fresh).tolist()
 
     def get_embedding(self, text: str) -> List[float]:
-        embedding = self.client.embeddings.create(
-            input=text, model=self.embeddings_model_name
-        )
+        with instrumentation.span("embedding.get_embedding", model=self.embeddings_model_name) as span:
+            if self.query_cache is not None:
+                cached = self.query_cache.get(self._cache_model, text)
+                if cached is not None:
+                    span.set(cache_hit=True)
+                    return cached.tolist()
+
+            embedding = self.client.embeddings.create(
+                input=text, **self._request_options()
+            )
 
-        return embedding.data[0].embedding
+        return self._single(text, embedding)
 
 
 if __name__ == "__main__":
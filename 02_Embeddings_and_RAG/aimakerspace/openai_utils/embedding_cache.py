@@ -0,0 +1,204 @@
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+def normalize_query(text: str) -> str:
+    """Canonical form of a query for cache lookups: NFKC, trimmed, with runs of whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class QueryEmbeddingCache:
+    """
+    Size-bounded LRU cache of query embeddings with an optional SQLite disk tier.
+
+    Entries are keyed by ``(model name, normalized text)`` and held as float32
+    arrays. When ``path`` is given, every computed embedding is also written to
+    disk and memory misses fall back to it, so repeated questions stay cheap
+    across restarts. Safe to share between threads.
+    """
+
+    def __init__(self, max_entries: int = 10_000, path: Optional[str] = None):
+        """
+        :param max_entries: Embeddings kept in memory before the least recently used is evicted
+        :param path: Optional SQLite file used as a persistent second tier
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, text))"
+            )
+            self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        """Return the cached embedding of ``text`` under ``model``, or None (counted as a miss)."""
+        key = (model, normalize_query(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM query_embeddings WHERE model = ? AND text = ?", key
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype="<f4")
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, model: str, text: str, embedding) -> np.ndarray:
+        """Cache ``embedding`` for ``text`` under ``model`` and return it as a float32 array."""
+        key = (model, normalize_query(text))
+        vector = np.asarray(embedding, dtype="<f4")
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, text, vector) VALUES (?, ?, ?)",
+                    (*key, vector.tobytes()),
+                )
+                self._db.commit()
+        return vector
+
+    def _remember(self, key: Tuple[str, str], vector: np.ndarray) -> None:
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and the current in-memory size."""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def clear(self) -> None:
+        """Drop every cached embedding (both tiers) and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM query_embeddings")
+                self._db.commit()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def text_digest(text: str) -> bytes:
+    """SHA-256 of the exact UTF-8 text; document chunks are not normalised, unlike queries."""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    """
+    Persistent content-addressed store of document embeddings.
+
+    Vectors are keyed by ``(model name, dimensions, SHA-256 of the chunk text)`` and
+    stored as raw float32 blobs in SQLite, so re-ingesting an unchanged corpus only
+    reads them back instead of calling the API. ``dimensions`` is 0 for a model's
+    native size. Safe to share between threads.
+    """
+
+    # SQLite caps the number of bound parameters per statement.
+    _LOOKUP_BATCH = 900
+
+    def __init__(self, path: str):
+        """
+        :param path: SQLite file holding the embeddings (created if missing)
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS document_embeddings ("
+            "model TEXT NOT NULL, dimensions INTEGER NOT NULL, digest BLOB NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, dimensions, digest)) WITHOUT ROWID"
+        )
+        self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM document_embeddings").fetchone()[0]
+
+    def get_many(self, model: str, dimensions: Optional[int], texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Stored embedding (a read-only float32 array) of each text, or None for the misses."""
+        digests = [text_digest(text) for text in texts]
+        found: Dict[bytes, bytes] = {}
+        unique = list(dict.fromkeys(digests))
+        with self._lock:
+            for start in range(0, len(unique), self._LOOKUP_BATCH):
+                batch = unique[start : start + self._LOOKUP_BATCH]
+                rows = self._db.execute(
+                    "SELECT digest, vector FROM document_embeddings WHERE model = ? AND dimensions = ? "
+                    f"AND digest IN ({', '.join('?' * len(batch))})",
+                    (model, dimensions or 0, *batch),
+                ).fetchall()
+                found.update(rows)
+            vectors = [np.frombuffer(found[digest], dtype="<f4") if digest in found else None for digest in digests]
+            hits = sum(vector is not None for vector in vectors)
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, model: str, dimensions: Optional[int], texts: List[str], vectors) -> None:
+        """Store the embedding of each text (one row of ``vectors`` per text) in one transaction."""
+        vectors = np.asarray(vectors, dtype="<f4")
+        rows = [
+            (model, dimensions or 0, text_digest(text), vector.tobytes())
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO document_embeddings (model, dimensions, digest, vector) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters since this store was opened and the number of stored embeddings."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,234 @@
+import copy
+import numpy as np
+from typing import Optional
+
+from aimakerspace.indexes import cluster_sums
+
+
+def kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    n_iter: int = 20,
+    seed: int = 0,
+    block_size: int = 65536,
+) -> np.ndarray:
+    """Plain (Euclidean) k-means returning (n_clusters, dim) centroids."""
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    n_clusters = max(1, min(n_clusters, n))
+    centroids = vectors[rng.choice(n, size=n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignment = nearest_centroids(vectors, centroids, block_size)
+        sums = cluster_sums(vectors, assignment, n_clusters)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(n, size=int(empty.sum()), replace=False)]
+            counts[empty] = 1
+        centroids = sums / counts[:, None]
+    return centroids.astype(np.float32)
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray, block_size: int = 65536) -> np.ndarray:
+    """Index of the closest centroid (squared L2) for every row of ``vectors``."""
+    centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+    assignment = np.empty(vectors.shape[0], dtype=np.intp)
+    for start in range(0, vectors.shape[0], block_size):
+        block = vectors[start : start + block_size]
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2, and ||x||^2 does not affect the argmin.
+        assignment[start : start + block_size] = np.argmin(centroid_norms - 2 * (block @ centroids.T), axis=1)
+    return assignment
+
+
+class Quantizer:
+    """
+    Base class for compressed copies of a VectorDatabase's unit vectors.
+
+    A quantizer owns one code row per database row and produces approximate dot
+    products between a query and the encoded unit vectors, which the database uses
+    as a cheap first pass before (optionally) re-scoring a shortlist exactly.
+    """
+
+    name = "none"
+
+    def __init__(self, min_train_size: int = 1024, max_train_samples: int = 65536, seed: int = 0):
+        """
+        :param min_train_size: Rows required before the quantizer trains (exact search until then)
+        :param max_train_samples: Upper bound on the training sample size
+        :param seed: Random seed for training
+        """
+        self.min_train_size = min_train_size
+        self.max_train_samples = max_train_samples
+        self.seed = seed
+        self._codes: Optional[np.ndarray] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self._codes is not None
+
+    @property
+    def code_size(self) -> int:
+        """Bytes used per encoded vector."""
+        raise NotImplementedError
+
+    def should_build(self, size: int) -> bool:
+        return self._codes is None and size >= self.min_train_size
+
+    def train(self, sample: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def build(self, vectors: np.ndarray) -> None:
+        """Train on a sample of ``vectors`` and encode all of them (row ids are positions)."""
+        n = vectors.shape[0]
+        rng = np.random.default_rng(self.seed)
+        sample = vectors if n <= self.max_train_samples else vectors[rng.choice(n, self.max_train_samples, replace=False)]
+        self.train(np.asarray(sample, dtype=np.float32))
+        self._codes = self.encode(vectors)
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        codes = self.encode(vectors)
+        required = int(rows.max()) + 1
+        if required > self._codes.shape[0]:
+            capacity = max(required, 2 * self._codes.shape[0])
+            grown = np.zeros((capacity,) + self._codes.shape[1:], dtype=self._codes.dtype)
+            grown[: self._codes.shape[0]] = self._codes
+            self._codes = grown
+        self._codes[rows] = codes
+
+    def compacted(self, live_rows: np.ndarray, vectors: np.ndarray) -> "Quantizer":
+        """Return a copy holding only the codes of ``live_rows`` (in order), keeping the trained codebook."""
+        clone = copy.copy(self)
+        if self._codes is not None:
+            clone._codes = self._codes[live_rows]
+        return clone
+
+    def _code_block(self, rows: Optional[np.ndarray], start: int, stop: int) -> np.ndarray:
+        return self._codes[start:stop] if rows is None else self._codes[rows[start:stop]]
+
+    def score(self, query: np.ndarray, rows: Optional[np.ndarray], size: int) -> np.ndarray:
+        """Approximate dot products of ``query`` with the unit vectors of ``rows`` (or rows [0, size))."""
+        raise NotImplementedError
+
+    def memory_bytes(self, size: int) -> int:
+        """Bytes used by the codes of ``size`` rows."""
+        return size * self.code_size
+
+
+class ScalarQuantizer(Quantizer):
+    """
+    Symmetric per-dimension int8 scalar quantization (4x smaller than float32).
+
+    Each dimension is scaled by the largest magnitude seen during training and
+    rounded to [-127, 127]; values outside the trained range are clipped.
+    """
+
+    name = "int8"
+
+    def __init__(self, block_size: int = 65536, **kwargs):
+        super().__init__(**kwargs)
+        self.block_size = block_size
+        self.scale: Optional[np.ndarray] = None
+
+    @property
+    def code_size(self) -> int:
+        return self.scale.shape[0]
+
+    def train(self, sample: np.ndarray) -> None:
+        scale = np.max(np.abs(sample), axis=0) / 127.0
+        self.scale = np.where(scale > 0, scale, 1.0 / 127.0).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def score(self, query: np.ndarray, rows: Optional[np.ndarray], size: int) -> np.ndarray:
+        scaled_query = (query * self.scale).astype(np.float32)
+        n = size if rows is None else rows.shape[0]
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, self.block_size):
+            block = self._code_block(rows, start, min(start + self.block_size, n))
+            scores[start : start + block.shape[0]] = block.astype(np.float32) @ scaled_query
+        return scores
+
+
+class ProductQuantizer(Quantizer):
+    """
+    Product quantization: each vector is split into ``n_subvectors`` slices and every
+    slice is replaced by the id of its nearest of 256 k-means centroids (one byte).
+
+    Queries are scored with asymmetric distance computation: a (n_subvectors, 256)
+    table of query-slice/centroid dot products is built once and codes are scored by
+    table lookups.
+    """
+
+    name = "pq"
+
+    def __init__(self, n_subvectors: Optional[int] = None, n_iter: int = 15, block_size: int = 65536, **kwargs):
+        """
+        :param n_subvectors: Number of slices (must divide the dimension); defaults to
+            the largest divisor of the dimension not above dim / 8
+        :param n_iter: k-means iterations per slice
+        :param block_size: Rows scored per block, bounding temporary memory
+        """
+        super().__init__(**kwargs)
+        self.n_subvectors = n_subvectors
+        self.n_iter = n_iter
+        self.block_size = block_size
+        self.codebooks: Optional[np.ndarray] = None
+
+    @property
+    def code_size(self) -> int:
+        return self.codebooks.shape[0]
+
+    def train(self, sample: np.ndarray) -> None:
+        dim = sample.shape[1]
+        n_subvectors = self.n_subvectors or max(d for d in range(1, max(1, dim // 8) + 1) if dim % d == 0)
+        if dim % n_subvectors != 0:
+            raise ValueError(f"n_subvectors={n_subvectors} must divide the vector dimension {dim}")
+        slices = sample.reshape(sample.shape[0], n_subvectors, dim // n_subvectors)
+        codebooks = np.zeros((n_subvectors, 256, dim // n_subvectors), dtype=np.float32)
+        for m in range(n_subvectors):
+            centroids = kmeans(slices[:, m], 256, n_iter=self.n_iter, seed=self.seed + m)
+            codebooks[m, : centroids.shape[0]] = centroids
+            # Fewer training points than 256: pad with copies so every code is valid.
+            codebooks[m, centroids.shape[0] :] = centroids[0]
+        self.codebooks = codebooks
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        n_subvectors, _, sub_dim = self.codebooks.shape
+        slices = np.asarray(vectors, dtype=np.float32).reshape(-1, n_subvectors, sub_dim)
+        codes = np.empty((slices.shape[0], n_subvectors), dtype=np.uint8)
+        for m in range(n_subvectors):
+            codes[:, m] = nearest_centroids(slices[:, m], self.codebooks[m])
+        return codes
+
+    def score(self, query: np.ndarray, rows: Optional[np.ndarray], size: int) -> np.ndarray:
+        n_subvectors, _, sub_dim = self.codebooks.shape
+        table = np.einsum("mkd,md->mk", self.codebooks, query.reshape(n_subvectors, sub_dim).astype(np.float32))
+        subspace = np.arange(n_subvectors)
+        n = size if rows is None else rows.shape[0]
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, self.block_size):
+            block = self._code_block(rows, start, min(start + self.block_size, n))
+            scores[start : start + block.shape[0]] = table[subspace, block].sum(axis=1)
+        return scores
+
+
+QUANTIZER_TYPES = {
+    "int8": ScalarQuantizer,
+    "pq": ProductQuantizer,
+}
+
+
+def create_quantizer(quantization) -> Optional[Quantizer]:
+    """Resolve a quantization name or instance to a Quantizer (None keeps full-precision scoring)."""
+    if quantization is None or quantization == "none":
+        return None
+    if isinstance(quantization, Quantizer):
+        return quantization
+    if quantization not in QUANTIZER_TYPES:
+        raise ValueError(f"Unknown quantization: {quantization}. Available: {list(QUANTIZER_TYPES.keys())}")
+    return QUANTIZER_TYPES[quantization]()
@@ -0,0 +1,420 @@
+import operator
+import numpy as np
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def _grown(array: np.ndarray, required: int, fill=0) -> np.ndarray:
+    """Return ``array`` or, if it is too short, a doubled copy (the old array is left intact for readers)."""
+    capacity = array.shape[0]
+    if required <= capacity:
+        return array
+    capacity = max(required, 2 * capacity, 16)
+    grown = np.full(capacity, fill, dtype=array.dtype)
+    grown[: array.shape[0]] = array
+    return grown
+
+
+class TextArena:
+    """
+    Append-only store of the row texts in one contiguous UTF-8 buffer plus offsets.
+
+    Row ``i`` occupies ``buffer[offsets[i]:offsets[i + 1]]``. Compared with one Python
+    ``str`` per row this removes the per-object overhead, and rows are written
+    before the count that exposes them, so readers of published rows never lock.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._buffer = np.zeros(max(16, capacity * 64), dtype=np.uint8)
+        self._offsets = np.zeros(capacity + 1, dtype=np.int64)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append_many(self, texts: Iterable[str]) -> None:
+        encoded = [text.encode("utf-8") for text in texts]
+        start = int(self._offsets[self._count])
+        lengths = np.fromiter((len(item) for item in encoded), dtype=np.int64, count=len(encoded))
+        ends = start + np.cumsum(lengths)
+        stop = int(ends[-1]) if len(encoded) else start
+        buffer = _grown(self._buffer, stop)
+        buffer[start:stop] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        offsets = _grown(self._offsets, self._count + len(encoded) + 1)
+        offsets[self._count + 1 : self._count + 1 + len(encoded)] = ends
+        self._buffer, self._offsets = buffer, offsets
+        self._count += len(encoded)
+
+    def get(self, row: int) -> str:
+        offsets = self._offsets
+        return self._buffer[offsets[row] : offsets[row + 1]].tobytes().decode("utf-8")
+
+    def compacted(self, rows: np.ndarray) -> "TextArena":
+        """Return a new arena holding only ``rows``, in order."""
+        arena = TextArena(max(1, rows.shape[0]))
+        starts, ends = self._offsets[rows], self._offsets[rows + 1]
+        lengths = ends - starts
+        arena._offsets = np.zeros(rows.shape[0] + 1, dtype=np.int64)
+        np.cumsum(lengths, out=arena._offsets[1:])
+        # Gather every kept byte range with one fancy index.
+        positions = np.repeat(starts - arena._offsets[:-1], lengths) + np.arange(int(lengths.sum()))
+        arena._buffer = self._buffer[positions]
+        arena._count = rows.shape[0]
+        return arena
+
+    def memory_bytes(self) -> int:
+        return int(self._offsets[self._count]) + 8 * (self._count + 1)
+
+
+class KeyIndex:
+    """
+    O(1) ``key -> row`` lookup that keeps no copy of the key text.
+
+    Rows are found through the key's hash and confirmed against the text arena;
+    the rare keys whose hash collides with a different live key go to a small
+    overflow dictionary keyed by the full text.
+    """
+
+    def __init__(self):
+        self._rows: Dict[int, int] = {}
+        self._overflow: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows) + len(self._overflow)
+
+    def get(self, key: str, texts: TextArena) -> Optional[int]:
+        row = self._rows.get(hash(key))
+        if row is not None and texts.get(row) == key:
+            return row
+        return self._overflow.get(key) if self._overflow else None
+
+    def set(self, key: str, row: int, texts: TextArena) -> None:
+        """Map ``key`` to ``row``; ``key`` must not currently be mapped."""
+        digest = hash(key)
+        if digest in self._rows and texts.get(self._rows[digest]) != key:
+            self._overflow[key] = row
+        else:
+            self._rows[digest] = row
+
+    def pop(self, key: str, texts: TextArena) -> Optional[int]:
+        digest = hash(key)
+        row = self._rows.get(digest)
+        if row is not None and texts.get(row) == key:
+            del self._rows[digest]
+            return row
+        return self._overflow.pop(key, None)
+
+    def remapped(self, old_to_new: np.ndarray) -> "KeyIndex":
+        """Return a copy with every row translated through ``old_to_new`` (after compaction)."""
+        index = KeyIndex()
+        digests = list(self._rows)
+        if digests:
+            rows = old_to_new[np.fromiter(self._rows.values(), dtype=np.intp, count=len(digests))]
+            index._rows = dict(zip(digests, rows.tolist()))
+        index._overflow = {key: int(old_to_new[row]) for key, row in self._overflow.items()}
+        return index
+
+
+_KINDS = {"bool": bool, "int": int, "float": float, "str": str}
+
+_COMPARISONS = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+}
+FILTER_OPERATORS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin")
+
+
+def is_operator_filter(value: Any) -> bool:
+    """Whether a filter value is an operator document such as ``{"$gte": 10, "$lt": 40}``."""
+    return isinstance(value, dict) and bool(value) and all(isinstance(op, str) and op.startswith("$") for op in value)
+
+
+def _kind_of(value: Any) -> str:
+    if value is None:
+        return "null"
+    # bool is checked first because it is a subclass of int.
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int) and -(2**63) <= value < 2**63:
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return "str"
+    return "object"
+
+
+# Largest magnitude up to which every int converts to float64 and back unchanged.
+_MAX_EXACT_FLOAT_INT = 2**53
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (bool, int, float, np.number))
+
+
+def _compare(compare, value: Any, operand: Any) -> bool:
+    try:
+        return bool(compare(value, operand))
+    except TypeError:
+        return False
+
+
+class _Column:
+    """
+    One metadata field across all rows: typed values plus presence and null masks.
+
+    Strings are dictionary-encoded (int32 codes into ``categories``); values that do
+    not fit one scalar type (lists, dicts, mixed types) use an object column. ``None``
+    is recorded in the null mask, so it does not force a typed column to objects.
+    Ints and floats share a float column, with an ``ints`` mask recording which rows
+    held ints so they read back as ints.
+    """
+
+    __slots__ = ("kind", "values", "present", "nulls", "categories", "codes", "ints")
+
+    _DTYPES = {"null": np.bool_, "bool": np.bool_, "int": np.int64, "float": np.float64, "str": np.int32, "object": object}
+
+    def __init__(self, kind: str, capacity: int):
+        self.kind = kind
+        self.values = np.zeros(capacity, dtype=self._DTYPES[kind]) if kind != "object" else np.full(capacity, None)
+        self.present = np.zeros(capacity, dtype=bool)
+        self.nulls = np.zeros(capacity, dtype=bool)
+        self.categories: List[str] = []
+        self.codes: Dict[str, int] = {}
+        self.ints: Optional[np.ndarray] = None
+
+    def encode(self, value: Any) -> Any:
+        if self.kind != "str":
+            return value
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.categories)
+            self.categories.append(value)
+        return code
+
+    def decode(self, row: int) -> Any:
+        if self.nulls[row]:
+            return None
+        value = self.values[row]
+        if self.kind == "str":
+            return self.categories[value]
+        if self.kind == "object":
+            return value
+        if self.ints is not None and self.ints[row]:
+            return int(value)
+        return _KINDS[self.kind](value)
+
+    def grow(self, capacity: int) -> None:
+        self.values = _grown(self.values, capacity, None if self.kind == "object" else 0)
+        self.present = _grown(self.present, capacity, False)
+        self.nulls = _grown(self.nulls, capacity, False)
+        if self.ints is not None:
+            self.ints = _grown(self.ints, capacity, False)
+
+    def retyped(self, kind: str, size: int) -> "_Column":
+        """
+        Copy of this column as ``kind``, used when a value of another type arrives.
+
+        A column holding only nulls takes the new type, an int column becomes a float
+        column (see :meth:`promotion`), and any other change boxes the values into an
+        object column.
+        """
+        column = _Column(kind, self.values.shape[0])
+        if kind == "object":
+            for row in np.flatnonzero(self.present[:size] & ~self.nulls[:size]).tolist():
+                column.values[row] = self.decode(row)
+        elif kind == "float" and self.kind == "int":
+            column.values[:size] = self.values[:size]
+            column.ints = self.present & ~self.nulls
+        column.present[:size] = self.present[:size]
+        column.nulls[:size] = self.nulls[:size]
+        return column
+
+    def take(self, rows: np.ndarray) -> "_Column":
+        column = _Column(self.kind, max(1, rows.shape[0]))
+        column.values = self.values[rows]
+        column.present = self.present[rows]
+        column.nulls = self.nulls[rows]
+        if self.ints is not None:
+            column.ints = self.ints[rows]
+        column.categories, column.codes = list(self.categories), dict(self.codes)
+        return column
+
+    def promotion(self, kind: str, size: int) -> str:
+        """The kind this column must become to also hold a value of ``kind`` (its own if none)."""
+        if kind == "null" or kind == self.kind or self.kind == "object":
+            return self.kind
+        if self.kind == "null":
+            return kind
+        if {self.kind, kind} == {"int", "float"} and self._exact_as_float(size):
+            return "float"
+        return "object"
+
+    def _exact_as_float(self, size: int) -> bool:
+        """Whether the ints held so far survive conversion to float64."""
+        if self.kind != "int":
+            return True
+        held = self.values[:size][self.present[:size] & ~self.nulls[:size]]
+        return not held.size or bool(np.abs(held).max() <= _MAX_EXACT_FLOAT_INT)
+
+    def matches(self, op: str, operand: Any, size: int) -> np.ndarray:
+        """Vectorised mask of the first ``size`` rows satisfying ``op operand``."""
+        if op == "$ne":
+            return ~self.matches("$eq", operand, size)
+        if op == "$nin":
+            return ~self.matches("$in", operand, size)
+        present, nulls = self.present[:size], self.nulls[:size]
+        if op == "$in":
+            if not isinstance(operand, (list, tuple, set)):
+                raise ValueError(f"$in/$nin need a list of values, got {operand!r}")
+            mask = present & nulls if any(option is None for option in operand) else np.zeros(size, dtype=bool)
+            if self.kind == "str":
+                codes = [self.codes[option] for option in operand if isinstance(option, str) and option in self.codes]
+                return mask | (present & ~nulls & np.isin(self.values[:size], codes))
+            if self.kind in _KINDS:
+                numbers = [option for option in operand if _is_number(option)]
+                return mask | (present & ~nulls & np.isin(self.values[:size], numbers))
+            for option in operand:
+                if option is not None:
+                    mask |= self.matches("$eq", option, size)
+            return mask
+        if op not in _COMPARISONS:
+            raise ValueError(f"Unknown filter operator: {op}. Available: {list(FILTER_OPERATORS)}")
+        if operand is None:
+            return present & nulls if op == "$eq" else np.zeros(size, dtype=bool)
+
+        compare = _COMPARISONS[op]
+        values = present & ~nulls
+        if self.kind == "str":
+            if not isinstance(operand, str):
+                return np.zeros(size, dtype=bool)
+            if op == "$eq":
+                code = self.codes.get(operand)
+                return values & (self.values[:size] == code) if code is not None else np.zeros(size, dtype=bool)
+            # Evaluate once per distinct string, then broadcast through the codes.
+            by_category = np.fromiter(
+                (compare(category, operand) for category in self.categories), dtype=bool, count=len(self.categories)
+            )
+            return values & by_category[self.values[:size]] if by_category.size else np.zeros(size, dtype=bool)
+        if self.kind in _KINDS:
+            if not _is_number(operand):
+                return np.zeros(size, dtype=bool)
+            return values & compare(self.values[:size], operand)
+        mask = np.zeros(size, dtype=bool)
+        for row in np.flatnonzero(values).tolist():
+            mask[row] = _compare(compare, self.values[row], operand)
+        return mask
+
+
+class ColumnarMetadata:
+    """
+    Row-aligned metadata stored column by column instead of one dict per row.
+
+    Each field is a typed NumPy column with a presence mask, so numeric and string
+    fields cost a few bytes per row and can be filtered with vectorised masks. A
+    row's dict is rebuilt on demand by :meth:`get`. Rows are append-only and the
+    field table is replaced (never mutated) when a field is added or retyped, so
+    published rows can be read without locking.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._capacity = max(1, capacity)
+        self._columns: Dict[str, _Column] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append_many(self, items: List[Optional[Dict[str, Any]]]) -> None:
+        start, stop = self._count, self._count + len(items)
+        if stop > self._capacity:
+            self._capacity = max(stop, 2 * self._capacity)
+            for column in self._columns.values():
+                column.grow(self._capacity)
+        columns = self._columns
+        for row, metadata in zip(range(start, stop), items):
+            for field, value in (metadata or {}).items():
+                column = columns.get(field)
+                kind = _kind_of(value)
+                if kind == "int" and abs(value) > _MAX_EXACT_FLOAT_INT and column is not None:
+                    if column.kind == "float":
+                        # Too large to store exactly as a float.
+                        kind = "object"
+                if column is None:
+                    column = _Column(kind, self._capacity)
+                    columns = {**columns, field: column}
+                else:
+                    promoted = column.promotion(kind, row)
+                    if promoted != column.kind:
+                        column = column.retyped(promoted, row)
+                        columns = {**columns, field: column}
+                if kind == "null":
+                    column.nulls[row] = True
+                else:
+                    column.values[row] = column.encode(value)
+                    if column.ints is not None:
+                        column.ints[row] = kind == "int"
+                    elif kind == "int" and column.kind == "float":
+                        column.ints = np.zeros(column.values.shape[0], dtype=bool)
+                        column.ints[row] = True
+                column.present[row] = True
+            self._columns = columns
+        self._count = stop
+
+    def get(self, row: int) -> Optional[Dict[str, Any]]:
+        """The metadata dict of ``row`` (None when it has none)."""
+        item = {field: column.decode(row) for field, column in self._columns.items() if column.present[row]}
+        return item or None
+
+    def has_metadata(self, size: int) -> np.ndarray:
+        """Mask of the first ``size`` rows that carry any metadata."""
+        mask = np.zeros(size, dtype=bool)
+        for column in self._columns.values():
+            mask |= column.present[:size]
+        return mask
+
+    def fields(self) -> List[str]:
+        return sorted(self._columns)
+
+    def column(self, field: str) -> Optional[_Column]:
+        return self._columns.get(field)
+
+    def mask(self, predicates: Dict[str, Dict[str, Any]], size: int) -> np.ndarray:
+        """
+        Mask of the first ``size`` rows satisfying every ``{field: {operator: operand}}`` predicate.
+
+        Operators are ``$eq``, ``$ne``, ``$gt``, ``$gte``, ``$lt``, ``$lte``, ``$in`` and
+        ``$nin``. Ordering compares numbers with numbers and strings with strings (so
+        ISO dates work); a row whose value has another type, or that lacks the field,
+        only satisfies ``$ne`` and ``$nin``.
+        """
+        mask = np.ones(size, dtype=bool)
+        columns = self._columns
+        for field, operators in predicates.items():
+            column = columns.get(field)
+            for op, operand in operators.items():
+                if op not in FILTER_OPERATORS:
+                    raise ValueError(f"Unknown filter operator: {op}. Available: {list(FILTER_OPERATORS)}")
+                if column is not None:
+                    mask &= column.matches(op, operand, size)
+                elif op not in ("$ne", "$nin"):
+                    return np.zeros(size, dtype=bool)
+        return mask
+
+    def compacted(self, rows: np.ndarray) -> "ColumnarMetadata":
+        """Return a new store holding only ``rows``, in order."""
+        store = ColumnarMetadata(max(1, rows.shape[0]))
+        store._columns = {field: column.take(rows) for field, column in self._columns.items()}
+        store._count = rows.shape[0]
+        return store
+
+    def memory_bytes(self) -> int:
+        total = 0
+        for column in self._columns.values():
+            total += column.values[: self._count].nbytes + 2 * self._count
+            total += sum(len(category) for category in column.categories)
+        return total
+
@@ -1,7 +1,28 @@
+import copy
+import functools
+import heapq
+import json
+import os
+import pickle
+import shutil
+import sys
+import threading
+import time
 import numpy as np
 from collections import defaultdict
-from typing import List, Tuple, Callable, Dict, Any, Optional
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import List, Tuple, Callable, Dict, Any, Optional, Iterator, NamedTuple, Union
+from aimakerspace import instrumentation
 from aimakerspace.openai_utils.embedding import EmbeddingModel
+from aimakerspace.bm25 import BM25Index
+from aimakerspace.dedup import DedupReport, MinHashDeduplicator
+from aimakerspace.indexes import VectorIndex, create_index
+from aimakerspace.metadata_index import MetadataIndex
+from aimakerspace.quantization import Quantizer, create_quantizer
+from aimakerspace.records import ColumnarMetadata, KeyIndex, TextArena, _grown, is_operator_filter
+from aimakerspace.wal import LogRecord, WriteAheadLog
 import asyncio
 
 
@@ -42,18 +63,832 @@ DISTANCE_METRICS = {
     "chebyshev": chebyshev_distance,
 }
 
+# Batched metrics score a (q, dim) block of queries against stored rows in one call and
+# return a (q, n) score matrix. The database keeps unit-length rows plus their original
+# norms, so each metric receives both and reconstructs only what it needs.
+BatchedMetric = Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]
+
+# Elements of the reconstructed (rows, dim) block that L1/L-inf hold at once (16 MiB of float32).
+_METRIC_BLOCK_ELEMENTS = 1 << 22
+
+
+def batched_cosine_similarity(queries: np.ndarray, unit_rows: np.ndarray, norms: np.ndarray) -> np.ndarray:
+    """Cosine similarity of every query against every row."""
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ unit_rows.T
+
+
+def batched_dot_product_similarity(queries: np.ndarray, unit_rows: np.ndarray, norms: np.ndarray) -> np.ndarray:
+    """Dot product of every query against every row."""
+    return (queries @ unit_rows.T) * norms
+
+
+def batched_euclidean_distance(queries: np.ndarray, unit_rows: np.ndarray, norms: np.ndarray) -> np.ndarray:
+    """Negative Euclidean distance via ||q - x||^2 = ||q||^2 - 2 q.x + ||x||^2 (one matrix product)."""
+    query_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+    squared = query_norms - 2 * (queries @ unit_rows.T) * norms + norms * norms
+    # Rounding can push the squared distance of (near-)identical vectors just below zero.
+    return -np.sqrt(np.maximum(squared, 0))
+
+
+def _blocked_distance(reduce: Callable) -> BatchedMetric:
+    """Build a batched metric that reduces |x - q| over dimensions, reconstructing rows a block at a time."""
+
+    def batched(queries: np.ndarray, unit_rows: np.ndarray, norms: np.ndarray) -> np.ndarray:
+        n, dim = unit_rows.shape
+        scores = np.empty((queries.shape[0], n), dtype=np.float32)
+        block_size = max(1, _METRIC_BLOCK_ELEMENTS // max(1, dim))
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            block = unit_rows[start:stop] * norms[start:stop, None]
+            for i, query in enumerate(queries):
+                difference = np.subtract(block, query, out=np.empty_like(block))
+                scores[i, start:stop] = -reduce(np.abs(difference, out=difference), axis=1)
+        return scores
+
+    return batched
+
+
+batched_manhattan_distance = _blocked_distance(np.sum)
+batched_manhattan_distance.__doc__ = "Negative L1 distance, computed over bounded row blocks."
+batched_chebyshev_distance = _blocked_distance(np.max)
+batched_chebyshev_distance.__doc__ = "Negative L-infinity distance, computed over bounded row blocks."
+
+# Pairwise metric -> batched implementation. Callables missing here are applied pairwise.
+BATCHED_METRICS: Dict[Callable, BatchedMetric] = {
+    cosine_similarity: batched_cosine_similarity,
+    dot_product_similarity: batched_dot_product_similarity,
+    euclidean_distance: batched_euclidean_distance,
+    manhattan_distance: batched_manhattan_distance,
+    chebyshev_distance: batched_chebyshev_distance,
+}
+
+
+def register_metric(name: str, metric: Callable, batched: Optional[BatchedMetric] = None) -> None:
+    """
+    Make a metric available to ``search_by_distance_metric`` under ``name``.
+
+    :param metric: Pairwise ``(vector_a, vector_b) -> score`` function (higher is more similar)
+    :param batched: Optional ``(queries, unit_rows, norms) -> (q, n) scores`` implementation
+        used instead of calling ``metric`` once per stored row
+    """
+    DISTANCE_METRICS[name] = metric
+    if batched is not None:
+        BATCHED_METRICS[metric] = batched
+
+
+def _top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the indices of the k highest scores, best first (ties keep insertion order)."""
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates.sort()
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _fuse_results(
+    result_lists: List[List[Tuple[str, float, Dict[str, Any]]]],
+    weights: List[float],
+    k: int,
+    fusion: str,
+    rrf_k: int = 60,
+) -> List[Tuple[str, float, Dict[str, Any]]]:
+    """Merge ranked ``(key, score, metadata)`` lists into one top-k list by RRF or weighted scores."""
+    fused: Dict[str, float] = defaultdict(float)
+    metadata: Dict[str, Dict[str, Any]] = {}
+    for results, weight in zip(result_lists, weights):
+        if not results:
+            continue
+        scores = np.array([score for _, score, _ in results], dtype=np.float64)
+        if fusion == "rrf":
+            contributions = weight / (rrf_k + np.arange(1, len(results) + 1))
+        else:
+            spread = scores.max() - scores.min()
+            contributions = weight * ((scores - scores.min()) / spread if spread > 0 else np.ones_like(scores))
+        for (key, _, item_metadata), contribution in zip(results, contributions.tolist()):
+            fused[key] += contribution
+            metadata.setdefault(key, item_metadata)
+    # Sorting is stable, so ties keep the dense ranking's order.
+    ranked = sorted(fused.items(), key=lambda item: -item[1])[:k]
+    return [(key, score, metadata[key]) for key, score in ranked]
+
+
+def _atomic_write(path: str, write: Callable) -> None:
+    """Write a file through ``write(file)`` into a temporary sibling, then rename it into place."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _nbytes(obj: Any, seen: Optional[set] = None) -> int:
+    """Approximate memory held by ``obj``: array buffers plus the Python objects reachable from it."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_nbytes(key, seen) + _nbytes(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_nbytes(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += _nbytes(vars(obj), seen)
+    elif hasattr(obj, "__slots__"):
+        size += sum(_nbytes(getattr(obj, slot), seen) for slot in obj.__slots__ if hasattr(obj, slot))
+    return size
+
+
+class _Snapshot(NamedTuple):
+    """
+    One published version of the storage, read by searches without taking a lock.
+
+    Writers append rows past ``size`` and only then publish a new snapshot with the
+    larger size, so everything below ``size`` is fully written. Compaction publishes
+    a snapshot over brand-new arrays, leaving in-flight readers on the old ones.
+    """
+
+    matrix: Optional[np.ndarray]
+    norms: Optional[np.ndarray]
+    deleted: Optional[np.ndarray]
+    texts: TextArena
+    columns: ColumnarMetadata
+    key_index: KeyIndex
+    ids: np.ndarray
+    size: int
+    n_deleted: int
+    metadata_index: MetadataIndex
+    index: Optional[VectorIndex]
+    quantizer: Optional[Quantizer]
+    bm25: Optional[BM25Index]
+
+
+class _VectorView(Mapping):
+    """Read-only ``key -> vector`` view over the contiguous storage of a VectorDatabase."""
+
+    def __init__(self, db: "VectorDatabase"):
+        self._db = db
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        vector = self._db._lookup(key)[0]
+        if vector is None:
+            raise KeyError(key)
+        return vector
+
+    def __iter__(self) -> Iterator[str]:
+        return self._db._live_keys()
+
+    def __len__(self) -> int:
+        return len(self._db)
+
+
+class _MetadataView(Mapping):
+    """Read-only ``key -> metadata`` view over the columnar metadata of a VectorDatabase."""
+
+    def __init__(self, db: "VectorDatabase"):
+        self._db = db
+
+    def __getitem__(self, key: str) -> Dict[str, Any]:
+        vector, metadata = self._db._lookup(key)
+        if vector is None or not metadata:
+            raise KeyError(key)
+        return metadata
+
+    def __iter__(self) -> Iterator[str]:
+        snapshot = self._db._snapshot
+        if snapshot.size == 0:
+            return iter(())
+        rows = np.flatnonzero(~snapshot.deleted[: snapshot.size] & snapshot.columns.has_metadata(snapshot.size))
+        return (snapshot.texts.get(row) for row in rows.tolist())
+
+    def __len__(self) -> int:
+        snapshot = self._db._snapshot
+        if snapshot.size == 0:
+            return 0
+        return int(np.count_nonzero(~snapshot.deleted[: snapshot.size] & snapshot.columns.has_metadata(snapshot.size)))
+
 
 class VectorDatabase:
-    def __init__(self, embedding_model: EmbeddingModel = None):
-        self.vectors = defaultdict(np.array)
-        self.metadata = defaultdict(dict)  # Store metadata for each key
-        self.embedding_model = embedding_model or EmbeddingModel()
+    """
+    In-memory vector store with exact, indexed and quantized search.
+
+    Concurrency model: any number of threads may search while writers insert,
+    delete or compact. Writers serialise on a lock; readers never lock and instead
+    work from the latest published :class:`_Snapshot`, so a search sees either all
+    or none of a concurrent batch insert. A concurrent delete may drop a row from
+    an in-flight search's results.
+    """
+
+    def __init__(
+        self,
+        embedding_model: EmbeddingModel = None,
+        initial_capacity: int = 1024,
+        index: Optional[Union[str, VectorIndex]] = None,
+        quantization: Optional[Union[str, Quantizer]] = None,
+        rescore_factor: int = 4,
+        n_shards: int = 1,
+        bm25: Union[bool, BM25Index] = False,
+    ):
+        """
+        :param embedding_model: Model used to embed queries and documents
+        :param initial_capacity: Number of rows preallocated for the vector matrix
+        :param index: Optional approximate index ("ivf", "hnsw" or a VectorIndex instance);
+            brute-force exact search is used when omitted
+        :param quantization: Optional compressed codes ("int8", "pq" or a Quantizer instance)
+            used for first-pass cosine/dot-product scoring
+        :param rescore_factor: With quantization, the top ``k * rescore_factor`` candidates
+            are re-scored exactly in float32; 0 returns the approximate scores directly
+        :param n_shards: Number of row-range shards scored in parallel threads by exact
+            search (NumPy releases the GIL during the matrix products)
+        :param bm25: Maintain a BM25 keyword index over the keys (the chunk texts) for
+            :meth:`search_bm25` and :meth:`hybrid_search`; True or a configured BM25Index
+        """
+        # Created on first use so vector-only workloads (load, search by vector,
+        # benchmarks) do not need an API key.
+        self._embedding_model = embedding_model
+
+        # Vectors live in one growable float32 matrix of unit-length rows, with the
+        # original L2 norms kept alongside so non-cosine metrics can be recovered.
+        self._initial_capacity = max(1, initial_capacity)
+        self._dim: Optional[int] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._norms: Optional[np.ndarray] = None
+        # Rows are append-only: deletes and overwrites leave a tombstone that search
+        # skips until compact() rewrites the storage without them.
+        self._deleted: Optional[np.ndarray] = None
+        self._n_deleted = 0
+        self._size = 0
+        # Row records: the key texts in one contiguous arena, metadata as typed columns
+        # written with each row (so a search reports the metadata of the vector it
+        # scored even if the key is overwritten meanwhile), a hash-based key -> row
+        # lookup that stores no key copies, and a stable integer document id per row.
+        self._texts = TextArena(self._initial_capacity)
+        self._columns = ColumnarMetadata(self._initial_capacity)
+        self._key_index = KeyIndex()
+        self._ids = np.zeros(self._initial_capacity, dtype=np.int64)
+        self._next_id = 0
+        self._metadata_index = MetadataIndex()
+        self._index = create_index(index)
+        self._quantizer = create_quantizer(quantization)
+        self._bm25: Optional[BM25Index] = BM25Index() if bm25 is True else (bm25 or None)
+        self.rescore_factor = rescore_factor
+        self._write_lock = threading.RLock()
+        self.n_shards = max(1, n_shards)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_workers = 0
+        self._executor_lock = threading.Lock()
+        # Set by open(): every write is logged here before it is applied.
+        self._wal: Optional[WriteAheadLog] = None
+        self._wal_directory: Optional[str] = None
+        self.checkpoint_bytes = 64 * 1024 * 1024
+        # Savings of the last deduplicated abuild_from_list_with_metadata call.
+        self.last_dedup_report: Optional[DedupReport] = None
+        self._publish()
+
+    @property
+    def embedding_model(self) -> EmbeddingModel:
+        if self._embedding_model is None:
+            self._embedding_model = EmbeddingModel()
+        return self._embedding_model
+
+    @embedding_model.setter
+    def embedding_model(self, embedding_model: EmbeddingModel) -> None:
+        self._embedding_model = embedding_model
+
+    @property
+    def vectors(self) -> Mapping:
+        """Mapping of key to (float32) vector, kept for backwards compatibility."""
+        return _VectorView(self)
+
+    @property
+    def metadata(self) -> Mapping:
+        """Mapping of key to metadata for the keys that have any, kept for backwards compatibility."""
+        return _MetadataView(self)
+
+    def __len__(self) -> int:
+        snapshot = self._snapshot
+        return snapshot.size - snapshot.n_deleted
+
+    def _publish(self) -> None:
+        """Make the writer's current state visible to readers (a single reference swap)."""
+        self._snapshot = _Snapshot(
+            self._matrix,
+            self._norms,
+            self._deleted,
+            self._texts,
+            self._columns,
+            self._key_index,
+            self._ids,
+            self._size,
+            self._n_deleted,
+            self._metadata_index,
+            self._index,
+            self._quantizer,
+            self._bm25,
+        )
 
-    def insert(self, key: str, vector: np.array, metadata: Optional[Dict[str, Any]] = None) -> None:
-        """Insert a vector with optional metadata."""
-        self.vectors[key] = vector
-        if metadata:
-            self.metadata[key] = metadata
+    def _live_keys(self) -> Iterator[str]:
+        snapshot = self._snapshot
+        if snapshot.size == 0:
+            return iter(())
+        rows = np.flatnonzero(~snapshot.deleted[: snapshot.size])
+        return (snapshot.texts.get(row) for row in rows.tolist())
+
+    def _allocate(self, dim: int) -> None:
+        self._dim = dim
+        self._matrix = np.zeros((self._initial_capacity, dim), dtype=np.float32)
+        self._norms = np.zeros(self._initial_capacity, dtype=np.float32)
+        self._deleted = np.zeros(self._initial_capacity, dtype=bool)
+
+    def _ensure_capacity(self, required: int) -> None:
+        capacity = self._matrix.shape[0]
+        if required <= capacity:
+            return
+        # A store loaded from an empty save has zero rows of capacity to double from.
+        capacity = max(capacity, self._initial_capacity)
+        while capacity < required:
+            capacity *= 2
+        # Grow by copying into new arrays; readers holding the old ones are unaffected.
+        matrix = np.zeros((capacity, self._dim), dtype=np.float32)
+        matrix[: self._size] = self._matrix[: self._size]
+        norms = np.zeros(capacity, dtype=np.float32)
+        norms[: self._size] = self._norms[: self._size]
+        deleted = np.zeros(capacity, dtype=bool)
+        deleted[: self._size] = self._deleted[: self._size]
+        self._matrix, self._norms, self._deleted = matrix, norms, deleted
+
+    def _prepare_vectors(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Validate a (n, dim) block and split it into unit rows and norms."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        if self._dim is not None and vectors.shape[1] != self._dim:
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match database dimension {self._dim}")
+        norms = np.linalg.norm(vectors, axis=1)
+        safe_norms = np.where(norms > 0, norms, 1.0)
+        return vectors / safe_norms[:, None], norms
+
+    def _lookup(self, key: str) -> Tuple[Optional[np.ndarray], Dict[str, Any]]:
+        """Return the vector and metadata stored for ``key`` as of one consistent snapshot."""
+        snapshot = self._snapshot
+        row = snapshot.key_index.get(key, snapshot.texts)
+        if row is not None and row >= snapshot.size:
+            # The row is being written right now; the writer publishes it before releasing the lock.
+            with self._write_lock:
+                snapshot = self._snapshot
+            row = snapshot.key_index.get(key, snapshot.texts)
+            if row is not None and row >= snapshot.size:
+                return None, {}
+        if row is None:
+            return None, {}
+        return snapshot.matrix[row] * snapshot.norms[row], snapshot.columns.get(row) or {}
+
+    def _tombstone(self, key: str) -> Optional[Dict[str, Any]]:
+        """Mark the row holding ``key`` as deleted and return the metadata it had."""
+        row = self._key_index.pop(key, self._texts)
+        if row is None:
+            return None
+        self._deleted[row] = True
+        if self._bm25 is not None:
+            self._bm25.remove(row, key)
+        self._n_deleted += 1
+        previous = self._columns.get(row)
+        if previous:
+            self._metadata_index.remove(row, previous)
+        return previous
+
+    def _write(
+        self,
+        keys: List[str],
+        vectors: np.ndarray,
+        metadata: Optional[List[Optional[Dict[str, Any]]]],
+        keep_metadata: bool,
+    ) -> np.ndarray:
+        """Append one row per key, tombstoning any row that previously held the key; returns the new ids."""
+        if len(keys) == 0:
+            return np.zeros(0, dtype=np.int64)
+        with self._write_lock:
+            # Everything that can fail runs before the first change a reader or the log could see.
+            unit_vectors, norms = self._prepare_vectors(vectors)
+            if unit_vectors.shape[0] != len(keys):
+                raise ValueError(f"Got {len(keys)} keys but {unit_vectors.shape[0]} vectors")
+            if not all(isinstance(key, str) for key in keys):
+                raise ValueError("Keys must be strings")
+            metadata = list(metadata) if metadata is not None else [None] * len(keys)
+            if len(metadata) != len(keys):
+                raise ValueError(f"Got {len(keys)} keys but {len(metadata)} metadata entries")
+            if not all(item_metadata is None or isinstance(item_metadata, Mapping) for item_metadata in metadata):
+                raise ValueError("Metadata entries must be mappings or None")
+
+            if self._dim is None:
+                self._allocate(unit_vectors.shape[1])
+            start, stop = self._size, self._size + len(keys)
+            # Rows past the published size are invisible, so staging them here is harmless if the write fails.
+            self._ensure_capacity(stop)
+            self._matrix[start:stop] = unit_vectors
+            self._norms[start:stop] = norms
+            index, quantizer = self._staged_index(stop)
+            if self._wal is not None:
+                raw_vectors = np.asarray(vectors, dtype=np.float32).reshape(unit_vectors.shape)
+                self._wal.append("write", keys, raw_vectors, metadata, keep_metadata)
+
+            # The texts go in first: the key index confirms a row by comparing its text.
+            self._texts.append_many(keys)
+            for row, key, item_metadata in zip(range(start, stop), keys, metadata):
+                previous = self._tombstone(key)
+                if not item_metadata and keep_metadata:
+                    item_metadata = previous
+                self._key_index.set(key, row, self._texts)
+                if self._bm25 is not None:
+                    # Index the row now: a later repeat of its key in this batch tombstones it.
+                    self._bm25.add([row], [key])
+                self._columns.append_many([item_metadata])
+                if item_metadata:
+                    self._metadata_index.add(row, item_metadata)
+            ids = np.arange(self._next_id, self._next_id + len(keys), dtype=np.int64)
+            self._ids = _grown(self._ids, stop)
+            self._ids[start:stop] = ids
+            self._next_id += len(keys)
+            self._apply_index(index, quantizer, np.arange(start, stop), unit_vectors)
+            self._size = stop
+            self._publish()
+            self._maybe_checkpoint()
+            return ids
+
+    def insert(self, key: str, vector: np.array, metadata: Optional[Dict[str, Any]] = None) -> int:
+        """Insert a vector with optional metadata and return its document id."""
+        return int(self._write([key], [vector], [metadata], keep_metadata=True)[0])
+
+    def insert_many(
+        self,
+        keys: List[str],
+        vectors: np.ndarray,
+        metadata: Optional[List[Optional[Dict[str, Any]]]] = None,
+    ) -> np.ndarray:
+        """
+        Insert a batch of vectors (one row per key) with optional per-key metadata.
+
+        Re-inserting an existing key replaces its vector (under a new document id);
+        its metadata is kept unless new metadata is given.
+
+        :return: The document ids assigned to the keys, in order
+        """
+        return self._write(list(keys), vectors, metadata, keep_metadata=True)
+
+    def upsert(self, key: str, vector: np.array, metadata: Optional[Dict[str, Any]] = None) -> int:
+        """Insert or fully replace ``key`` (vector and metadata) and return its document id."""
+        return int(self._write([key], [vector], [metadata], keep_metadata=False)[0])
+
+    def upsert_many(
+        self,
+        keys: List[str],
+        vectors: np.ndarray,
+        metadata: Optional[List[Optional[Dict[str, Any]]]] = None,
+    ) -> np.ndarray:
+        """Insert or fully replace a batch of keys (vector and metadata) and return their document ids."""
+        return self._write(list(keys), vectors, metadata, keep_metadata=False)
+
+    def delete(self, key: str) -> bool:
+        """Delete ``key`` in O(1) by tombstoning its row; returns whether the key existed."""
+        with self._write_lock:
+            if self._key_index.get(key, self._texts) is None:
+                return False
+            self._delete_keys([key])
+            return True
+
+    def delete_by_metadata(self, filter_criteria: Dict[str, Any]) -> int:
+        """Delete every key matching the metadata filter and return how many were removed."""
+        if not filter_criteria:
+            raise ValueError("delete_by_metadata requires a non-empty filter")
+        with self._write_lock:
+            keys = self.filter_by_metadata(filter_criteria)
+            if keys:
+                self._delete_keys(keys)
+            return len(keys)
+
+    def _delete_keys(self, keys: List[str]) -> None:
+        if self._wal is not None:
+            self._wal.append("delete", keys)
+        for key in keys:
+            self._tombstone(key)
+        self._publish()
+        self._maybe_checkpoint()
+
+    def compact(self, background: bool = False) -> Optional[threading.Thread]:
+        """
+        Rewrite the storage without tombstoned rows, reclaiming their space.
+
+        The compacted arrays, index and quantizer are built off to the side while
+        searches keep reading the current snapshot, then published in one swap.
+        Writers wait for the compaction to finish. With ``background=True`` the work
+        runs on a daemon thread, which is returned.
+        """
+        if background:
+            thread = threading.Thread(target=self.compact, name="VectorDatabase.compact", daemon=True)
+            thread.start()
+            return thread
+
+        with self._write_lock:
+            if self._n_deleted == 0:
+                return None
+            live_rows = np.flatnonzero(~self._deleted[: self._size])
+            size = live_rows.shape[0]
+            capacity = max(self._initial_capacity, size)
+            matrix = np.zeros((capacity, self._dim), dtype=np.float32)
+            matrix[:size] = self._matrix[live_rows]
+            norms = np.zeros(capacity, dtype=np.float32)
+            norms[:size] = self._norms[live_rows]
+            texts = self._texts.compacted(live_rows)
+            columns = self._columns.compacted(live_rows)
+            old_to_new = np.full(self._size, -1, dtype=np.intp)
+            old_to_new[live_rows] = np.arange(size)
+            key_index = self._key_index.remapped(old_to_new)
+            ids = self._ids[live_rows]
+
+            metadata_index = MetadataIndex()
+            for row in range(size):
+                item_metadata = columns.get(row)
+                if item_metadata:
+                    metadata_index.add(row, item_metadata)
+            index = self._index.compacted(live_rows, matrix[:size]) if self._index is not None else None
+            quantizer = self._quantizer.compacted(live_rows, matrix[:size]) if self._quantizer is not None else None
+            bm25 = self._bm25.compacted([texts.get(row) for row in range(size)]) if self._bm25 is not None else None
+
+            self._matrix, self._norms, self._deleted = matrix, norms, np.zeros(capacity, dtype=bool)
+            self._texts, self._columns, self._key_index, self._ids = texts, columns, key_index, ids
+            self._metadata_index, self._index, self._quantizer = metadata_index, index, quantizer
+            self._bm25 = bm25
+            self._size, self._n_deleted = size, 0
+            self._publish()
+        return None
+
+    @property
+    def index(self) -> Optional[VectorIndex]:
+        """The approximate index in use, or None for exact search."""
+        return self._index
+
+    def build_index(self, index: Union[str, VectorIndex] = "ivf") -> Optional[VectorIndex]:
+        """Attach an approximate index and build it from the vectors already stored."""
+        with self._write_lock:
+            structure = create_index(index)
+            if structure is not None and self._size > 0:
+                structure.build(self._matrix[: self._size])
+            self._index = structure
+            self._publish()
+        return structure
+
+    @property
+    def quantizer(self) -> Optional[Quantizer]:
+        """The quantizer used for first-pass scoring, or None."""
+        return self._quantizer
+
+    def build_quantizer(self, quantization: Union[str, Quantizer] = "int8") -> Optional[Quantizer]:
+        """Attach a quantizer and train/encode it from the vectors already stored."""
+        with self._write_lock:
+            structure = create_quantizer(quantization)
+            if structure is not None and self._size > 0:
+                structure.build(self._matrix[: self._size])
+            self._quantizer = structure
+            self._publish()
+        return structure
+
+    @property
+    def bm25(self) -> Optional[BM25Index]:
+        """The BM25 keyword index, or None."""
+        return self._bm25
+
+    def build_bm25(self, bm25: Optional[BM25Index] = None) -> BM25Index:
+        """Attach a BM25 index over the keys already stored (and every key written later)."""
+        with self._write_lock:
+            structure = bm25 or BM25Index()
+            live_rows = np.flatnonzero(~self._deleted[: self._size]).tolist() if self._size else []
+            structure.add(live_rows, [self._texts.get(row) for row in live_rows])
+            self._bm25 = structure
+            self._publish()
+        return structure
+
+    def _staged_index(self, size: int) -> Tuple[Optional[VectorIndex], Optional[Quantizer]]:
+        """
+        Return the index and quantizer to use once the store holds ``size`` rows.
+
+        A structure that becomes due is trained on a fresh copy, so a failed build
+        (e.g. a quantizer that does not fit the dimension) leaves the store untouched.
+        """
+        structures = []
+        for structure in (self._index, self._quantizer):
+            if structure is not None and not structure.is_ready and structure.should_build(size):
+                # Build a fresh copy so readers never see a half-built structure.
+                built = copy.copy(structure)
+                built.build(self._matrix[:size])
+                structure = built
+            structures.append(structure)
+        return structures[0], structures[1]
+
+    def _apply_index(
+        self,
+        index: Optional[VectorIndex],
+        quantizer: Optional[Quantizer],
+        rows: np.ndarray,
+        unit_vectors: np.ndarray,
+    ) -> None:
+        """Add the new rows to ready structures and swap in any that :meth:`_staged_index` built."""
+        if index is self._index and index is not None and index.is_ready:
+            index.add(rows, unit_vectors)
+        if quantizer is self._quantizer and quantizer is not None and quantizer.is_ready:
+            quantizer.add(rows, unit_vectors)
+        self._index, self._quantizer = index, quantizer
+
+    @staticmethod
+    def _uses_quantizer(snapshot: _Snapshot, distance_measure: Callable) -> bool:
+        return (
+            snapshot.quantizer is not None
+            and snapshot.quantizer.is_ready
+            and (distance_measure is cosine_similarity or distance_measure is dot_product_similarity)
+        )
+
+    def _is_approximate(self, snapshot: _Snapshot, distance_measure: Callable) -> bool:
+        return (snapshot.index is not None and snapshot.index.is_ready) or self._uses_quantizer(
+            snapshot, distance_measure
+        )
+
+    def _quantized_scores(
+        self,
+        snapshot: _Snapshot,
+        query_vector: np.ndarray,
+        k: int,
+        distance_measure: Callable,
+        rows: Optional[np.ndarray],
+        rescore_factor: int,
+    ) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """Score ``rows`` from the quantized codes, optionally re-scoring a shortlist exactly."""
+        query = np.asarray(query_vector, dtype=np.float32).ravel()
+        if distance_measure is cosine_similarity:
+            approx = snapshot.quantizer.score(query / np.linalg.norm(query), rows, snapshot.size)
+        else:
+            approx = snapshot.quantizer.score(query, rows, snapshot.size) * self._stored(snapshot, rows)[1]
+        self._mask_deleted(snapshot, approx, rows)
+        if not rescore_factor:
+            return rows, approx
+
+        shortlist = np.sort(_top_k_indices(approx, k * rescore_factor))
+        if rows is not None:
+            shortlist = rows[shortlist]
+        return shortlist, self._score(snapshot, query_vector, distance_measure, shortlist)
+
+    def _candidate_rows(
+        self,
+        snapshot: _Snapshot,
+        query_vector: np.ndarray,
+        k: int,
+        rows: Optional[np.ndarray],
+        **search_params,
+    ) -> Optional[np.ndarray]:
+        """Narrow ``rows`` to the index's candidates, keeping exact search as the fallback."""
+        if snapshot.index is None or not snapshot.index.is_ready:
+            return rows
+        query = np.asarray(query_vector, dtype=np.float32).ravel()
+        query_norm = np.linalg.norm(query)
+        query = query / query_norm if query_norm > 0 else query
+        candidates = self._live_candidates(snapshot, query, k, search_params)
+        if candidates.size < k:
+            # The probed lists are too small for k, or tombstones crowded live rows out of
+            # the candidate set: retry wider, then search exactly.
+            candidates = self._live_candidates(snapshot, query, k, snapshot.index.widened(search_params, 4))
+            if candidates.size < k:
+                return rows
+        if rows is not None:
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+            if candidates.size < k:
+                # The filter is more selective than the probed lists; search it exactly.
+                return rows
+        return candidates
+
+    @staticmethod
+    def _live_candidates(
+        snapshot: _Snapshot, query: np.ndarray, k: int, search_params: Dict[str, Any]
+    ) -> np.ndarray:
+        """The index's candidates for a unit query, minus unpublished and tombstoned rows."""
+        candidates = snapshot.index.candidates(query, k, **search_params)
+        # The index may already hold rows that this snapshot has not published yet.
+        candidates = candidates[: np.searchsorted(candidates, snapshot.size)]
+        if snapshot.n_deleted:
+            candidates = candidates[~snapshot.deleted[candidates]]
+        return candidates
+
+    @staticmethod
+    def _stored(
+        snapshot: _Snapshot,
+        rows: Optional[Union[np.ndarray, slice]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the unit-row matrix and norms for every row (or only ``rows``, an array or slice)."""
+        if rows is None:
+            return snapshot.matrix[: snapshot.size], snapshot.norms[: snapshot.size]
+        return snapshot.matrix[rows], snapshot.norms[rows]
+
+    def _score(
+        self,
+        snapshot: _Snapshot,
+        query_vector: np.ndarray,
+        distance_measure: Callable,
+        rows: Optional[Union[np.ndarray, slice]] = None,
+    ) -> np.ndarray:
+        """Score the query against every stored row (or only ``rows``); higher is better."""
+        matrix, norms = self._stored(snapshot, rows)
+        batched = BATCHED_METRICS.get(distance_measure)
+        if batched is not None:
+            return batched(np.asarray(query_vector, dtype=np.float32).reshape(1, -1), matrix, norms)[0]
+
+        # Arbitrary callables are applied pairwise to the reconstructed vectors.
+        return np.array(
+            [distance_measure(query_vector, matrix[i] * norms[i]) for i in range(matrix.shape[0])],
+            dtype=np.float64,
+        )
+
+    def _score_many(
+        self,
+        snapshot: _Snapshot,
+        query_vectors: np.ndarray,
+        distance_measure: Callable,
+        rows: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Score a (q, dim) block of queries at once, returning a (q, n) score matrix."""
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        batched = BATCHED_METRICS.get(distance_measure)
+        if batched is not None:
+            matrix, norms = self._stored(snapshot, rows)
+            return batched(queries, matrix, norms)
+        return np.stack([self._score(snapshot, query, distance_measure, rows) for query in queries])
+
+    @staticmethod
+    def _filter_rows(snapshot: _Snapshot, metadata_filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Resolve a metadata filter to the matching storage rows (None means every row).
+
+        Plain values (equality, or membership for a list) and lone ``$eq`` / ``$in``
+        operators go through the inverted index; range and negated operators
+        (``{"page": {"$gte": 10, "$lte": 40}}``) are evaluated as vectorised masks over
+        the metadata columns and intersected with the indexed rows.
+        """
+        if not metadata_filter:
+            return None
+        equality, predicates = {}, {}
+        for field, value in metadata_filter.items():
+            if not is_operator_filter(value):
+                equality[field] = value
+            elif len(value) == 1 and "$in" in value and isinstance(value["$in"], list):
+                equality[field] = value["$in"]
+            elif len(value) == 1 and "$eq" in value and not isinstance(value["$eq"], (list, dict)):
+                equality[field] = value["$eq"]
+            else:
+                predicates[field] = value
+
+        rows = None
+        if equality:
+            rows = snapshot.metadata_index.resolve(equality)
+            rows = rows[: np.searchsorted(rows, snapshot.size)]
+        if predicates:
+            mask = snapshot.columns.mask(predicates, snapshot.size)
+            rows = np.flatnonzero(mask) if rows is None else rows[mask[rows]]
+        return rows
+
+    @staticmethod
+    def _mask_deleted(
+        snapshot: _Snapshot,
+        scores: np.ndarray,
+        rows: Optional[Union[np.ndarray, slice]] = None,
+    ) -> None:
+        """Push the scores of tombstoned rows to -inf (in place) so they never rank."""
+        if snapshot.n_deleted:
+            deleted = snapshot.deleted[: scores.shape[0]] if rows is None else snapshot.deleted[rows]
+            scores[deleted] = -np.inf
+
+    def _result(self, snapshot: _Snapshot, row: int, score: float) -> Optional[Tuple[str, float, Dict[str, Any]]]:
+        if snapshot.deleted[row]:
+            return None
+        return snapshot.texts.get(row), score, snapshot.columns.get(row) or {}
+
+    def _collect_results(
+        self,
+        snapshot: _Snapshot,
+        scores: np.ndarray,
+        k: int,
+        rows: Optional[np.ndarray] = None,
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        self._mask_deleted(snapshot, scores, rows)
+        results = []
+        for i in _top_k_indices(scores, k):
+            result = self._result(snapshot, i if rows is None else rows[i], float(scores[i]))
+            if result is not None:
+                results.append(result)
+        return results
 
     def search(
         self,
@@ -61,32 +896,292 @@ class VectorDatabase:
         k: int,
         distance_measure: Callable = cosine_similarity,
         metadata_filter: Optional[Dict[str, Any]] = None,
+        exact: bool = False,
+        **search_params,
     ) -> List[Tuple[str, float, Dict[str, Any]]]:
-        """Search for similar vectors with optional metadata filtering."""
-        scores = []
-        for key, vector in self.vectors.items():
-            # Apply metadata filter if provided
-            if metadata_filter and not self._matches_filter(self.metadata.get(key, {}), metadata_filter):
-                continue
-            
-            score = distance_measure(query_vector, vector)
-            metadata = self.metadata.get(key, {})
-            scores.append((key, score, metadata))
-        
-        return sorted(scores, key=lambda x: x[1], reverse=True)[:k]
+        """
+        Search for similar vectors with optional metadata filtering.
 
-    def _matches_filter(self, item_metadata: Dict[str, Any], filter_criteria: Dict[str, Any]) -> bool:
-        """Check if item metadata matches filter criteria."""
-        for key, value in filter_criteria.items():
-            if key not in item_metadata:
-                return False
-            if isinstance(value, list):
-                # If filter value is a list, check if item value is in the list
-                if item_metadata[key] not in value:
-                    return False
-            elif item_metadata[key] != value:
-                return False
-        return True
+        When an index is attached it proposes the candidates that get scored, and a
+        quantizer scores them from compressed codes first. ``exact=True`` bypasses
+        both; ``search_params`` tune them for this query (``nprobe``, ``ef_search``,
+        ``rescore_factor``).
+
+        With instrumentation enabled the whole call and its filter, candidates, score
+        and select stages are timed (see :mod:`aimakerspace.instrumentation`).
+        """
+        if not instrumentation.enabled:
+            return self._search(query_vector, k, distance_measure, metadata_filter, exact, search_params)
+        with instrumentation.span("vectordb.search", k=k, exact=exact):
+            return self._search(query_vector, k, distance_measure, metadata_filter, exact, search_params)
+
+    def _search(
+        self,
+        query_vector: np.array,
+        k: int,
+        distance_measure: Callable,
+        metadata_filter: Optional[Dict[str, Any]],
+        exact: bool,
+        search_params: Dict[str, Any],
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        snapshot = self._snapshot
+        if snapshot.size == 0 or k <= 0:
+            return []
+
+        timed = instrumentation.enabled
+        started = time.perf_counter() if timed else 0.0
+        rows = self._filter_rows(snapshot, metadata_filter)
+        if timed and metadata_filter:
+            matched = snapshot.size if rows is None else rows.shape[0]
+            started = instrumentation.lap(
+                "vectordb.search.filter", started, rows=matched, selectivity=matched / snapshot.size
+            )
+        if rows is not None and rows.size == 0:
+            return []
+        if exact:
+            return self._exact_search(snapshot, query_vector, k, distance_measure, rows)
+
+        rescore_factor = search_params.pop("rescore_factor", self.rescore_factor)
+        if snapshot.index is not None:
+            rows = self._candidate_rows(snapshot, query_vector, k, rows, **search_params)
+            if timed:
+                started = instrumentation.lap(
+                    "vectordb.search.candidates",
+                    started,
+                    index=snapshot.index.name,
+                    rows=snapshot.size if rows is None else rows.shape[0],
+                )
+        if not self._uses_quantizer(snapshot, distance_measure):
+            return self._exact_search(snapshot, query_vector, k, distance_measure, rows)
+        rows, scores = self._quantized_scores(snapshot, query_vector, k, distance_measure, rows, rescore_factor)
+        if timed:
+            started = instrumentation.lap("vectordb.search.score", started, quantizer=snapshot.quantizer.name)
+        results = self._collect_results(snapshot, scores, k, rows)
+        if timed:
+            instrumentation.lap("vectordb.search.select", started)
+        return results
+
+    # Shards smaller than this are not worth a thread hand-off.
+    _MIN_SHARD_ROWS = 4096
+    # A filter matching at least this share of the rows is cheaper to apply as a score
+    # mask over the contiguous matrix than by gathering the matching rows.
+    _DENSE_FILTER_FRACTION = 0.5
+
+    def _shard_executor(self) -> ThreadPoolExecutor:
+        """The shard thread pool, created on first use and recreated when ``n_shards`` changes."""
+        with self._executor_lock:
+            if self._executor is None or self._executor_workers != self.n_shards:
+                # The old pool is not shut down: a search may still be mapping over it. Its
+                # idle threads exit once the last such search drops its reference.
+                self._executor = ThreadPoolExecutor(max_workers=self.n_shards, thread_name_prefix="vectordb-shard")
+                self._executor_workers = self.n_shards
+            return self._executor
+
+    def _exact_search(
+        self,
+        snapshot: _Snapshot,
+        query_vector: np.ndarray,
+        k: int,
+        distance_measure: Callable,
+        rows: Optional[np.ndarray],
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """Score ``rows`` (or every row) exactly, fanning out over shards when configured."""
+        n = snapshot.size if rows is None else rows.shape[0]
+        n_shards = min(self.n_shards, n // self._MIN_SHARD_ROWS)
+        timed = instrumentation.enabled
+        started = time.perf_counter() if timed else 0.0
+        if (
+            n_shards <= 1
+            and rows is not None
+            and n >= self._DENSE_FILTER_FRACTION * snapshot.size
+            and distance_measure in BATCHED_METRICS
+        ):
+            return self._masked_search(snapshot, query_vector, k, distance_measure, rows)
+        if n_shards <= 1:
+            scores = self._score(snapshot, query_vector, distance_measure, rows)
+            if timed:
+                started = instrumentation.lap("vectordb.search.score", started, rows=n)
+            results = self._collect_results(snapshot, scores, k, rows)
+            if timed:
+                instrumentation.lap("vectordb.search.select", started)
+            return results
+
+        executor = self._shard_executor()
+        bounds = np.linspace(0, n, n_shards + 1).astype(int).tolist()
+        shards = [
+            slice(lo, hi) if rows is None else rows[lo:hi]
+            for lo, hi in zip(bounds[:-1], bounds[1:])
+        ]
+        shard_results = executor.map(
+            lambda shard: self._shard_top_k(snapshot, query_vector, k, distance_measure, shard), shards
+        )
+        # Each shard's list is sorted best-first; a heap merge yields the global top-k.
+        merged = heapq.merge(*shard_results, key=lambda item: -item[0])
+        results = []
+        for score, row in islice(merged, k):
+            result = self._result(snapshot, row, score)
+            if result is not None:
+                results.append(result)
+        if timed:
+            # Shards score and select together, so the whole fan-out counts as scoring.
+            instrumentation.lap("vectordb.search.score", started, rows=n, shards=n_shards)
+        return results
+
+    def _masked_search(
+        self,
+        snapshot: _Snapshot,
+        query_vector: np.ndarray,
+        k: int,
+        distance_measure: Callable,
+        rows: np.ndarray,
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """Exact search over a broad filter: score every row in place, then mask out the rest."""
+        timed = instrumentation.enabled
+        started = time.perf_counter() if timed else 0.0
+        scores = self._score(snapshot, query_vector, distance_measure)
+        keep = np.zeros(snapshot.size, dtype=bool)
+        keep[rows] = True
+        if snapshot.n_deleted:
+            keep &= ~snapshot.deleted[: snapshot.size]
+        scores[~keep] = -np.inf
+        if timed:
+            started = instrumentation.lap("vectordb.search.score", started, rows=snapshot.size, masked=True)
+        results = []
+        for row in _top_k_indices(scores, min(k, int(keep.sum()))).tolist():
+            # A row deleted after ``keep`` was computed reads back as None.
+            result = self._result(snapshot, row, float(scores[row]))
+            if result is not None:
+                results.append(result)
+        if timed:
+            instrumentation.lap("vectordb.search.select", started)
+        return results
+
+    def _shard_top_k(
+        self,
+        snapshot: _Snapshot,
+        query_vector: np.ndarray,
+        k: int,
+        distance_measure: Callable,
+        shard: Union[slice, np.ndarray],
+    ) -> List[Tuple[float, int]]:
+        """Top-k ``(score, row)`` pairs within one shard, best first."""
+        scores = self._score(snapshot, query_vector, distance_measure, shard)
+        self._mask_deleted(snapshot, scores, shard)
+        top = _top_k_indices(scores, k)
+        shard_rows = top + shard.start if isinstance(shard, slice) else shard[top]
+        return list(zip(scores[top].tolist(), shard_rows.tolist()))
+
+    def search_many(
+        self,
+        query_vectors: np.ndarray,
+        k: int,
+        distance_measure: Callable = cosine_similarity,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        batch_size: int = 256,
+        exact: bool = False,
+        **search_params,
+    ) -> List[List[Tuple[str, float, Dict[str, Any]]]]:
+        """
+        Search for many query vectors at once, returning one top-k list per query.
+
+        Queries are scored in blocks of ``batch_size`` with a single matrix-matrix
+        product per block, which bounds the size of the intermediate score matrix.
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        if query_vectors.ndim == 1:
+            query_vectors = query_vectors.reshape(1, -1)
+        snapshot = self._snapshot
+        if snapshot.size == 0 or k <= 0:
+            return [[] for _ in range(len(query_vectors))]
+        if not exact and self._is_approximate(snapshot, distance_measure):
+            # Each query probes its own candidate set, so score them one at a time.
+            return [
+                self.search(query, k, distance_measure, metadata_filter, **search_params)
+                for query in query_vectors
+            ]
+
+        rows = self._filter_rows(snapshot, metadata_filter)
+        if rows is not None and rows.size == 0:
+            return [[] for _ in range(len(query_vectors))]
+
+        results = []
+        for start in range(0, len(query_vectors), batch_size):
+            block = query_vectors[start : start + batch_size]
+            block_scores = self._score_many(snapshot, block, distance_measure, rows)
+            results.extend(self._collect_results(snapshot, scores, k, rows) for scores in block_scores)
+        return results
+
+    def search_mmr(
+        self,
+        query_vector: np.array,
+        k: int,
+        fetch_k: Optional[int] = None,
+        lambda_mult: float = 0.5,
+        distance_measure: Callable = cosine_similarity,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        **search_params,
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """
+        Maximal Marginal Relevance search: pick ``k`` relevant but mutually diverse results.
+
+        The top ``fetch_k`` results (default ``4 * k``) of :meth:`search` form the pool.
+        Each step selects the candidate maximising
+        ``lambda_mult * sim(query, c) - (1 - lambda_mult) * max sim(c, selected)``, with
+        cosine similarities taken from one candidate-by-candidate matrix product.
+        Results keep the score ``distance_measure`` gave them, in selection order.
+
+        :param lambda_mult: 1 ranks purely by relevance, 0 purely by diversity
+        """
+        if not 0.0 <= lambda_mult <= 1.0:
+            raise ValueError("lambda_mult must be between 0 and 1")
+        if k <= 0:
+            return []
+        fetch_k = max(k, fetch_k or 4 * k)
+        pool = self.search(query_vector, fetch_k, distance_measure, metadata_filter, **search_params)
+        if len(pool) <= 1:
+            return pool[:k]
+
+        snapshot = self._snapshot
+        rows = [snapshot.key_index.get(key, snapshot.texts) for key, _, _ in pool]
+        # Keys rewritten since the search are dropped rather than scored against the wrong vector.
+        pool = [result for result, row in zip(pool, rows) if row is not None and row < snapshot.size]
+        candidates = snapshot.matrix[[row for row in rows if row is not None and row < snapshot.size]]
+        query = np.asarray(query_vector, dtype=np.float32).ravel()
+        relevance = candidates @ (query / np.linalg.norm(query))
+        similarity = candidates @ candidates.T
+
+        selected = [int(np.argmax(relevance))]
+        redundancy = similarity[selected[0]].copy()
+        available = np.ones(len(pool), dtype=bool)
+        available[selected[0]] = False
+        while len(selected) < min(k, len(pool)):
+            mmr = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+            mmr[~available] = -np.inf
+            choice = int(np.argmax(mmr))
+            selected.append(choice)
+            available[choice] = False
+            np.maximum(redundancy, similarity[choice], out=redundancy)
+        return [pool[i] for i in selected]
+
+    def search_mmr_by_text(
+        self,
+        query_text: str,
+        k: int,
+        fetch_k: Optional[int] = None,
+        lambda_mult: float = 0.5,
+        return_as_text: bool = False,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        **search_params,
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """Embed ``query_text`` and run :meth:`search_mmr`."""
+        query_vector = self.embedding_model.get_embedding(query_text)
+        results = self.search_mmr(
+            query_vector, k, fetch_k, lambda_mult, metadata_filter=metadata_filter, **search_params
+        )
+
+        if return_as_text:
+            return [result[0] for result in results]
+        return results
 
     def search_by_text(
         self,
@@ -95,64 +1190,571 @@ class VectorDatabase:
         distance_measure: Callable = cosine_similarity,
         return_as_text: bool = False,
         metadata_filter: Optional[Dict[str, Any]] = None,
+        **search_params,
     ) -> List[Tuple[str, float, Dict[str, Any]]]:
         """Search by text with optional metadata filtering."""
         query_vector = self.embedding_model.get_embedding(query_text)
-        results = self.search(query_vector, k, distance_measure, metadata_filter)
+        results = self.search(query_vector, k, distance_measure, metadata_filter, **search_params)
         
         if return_as_text:
             return [result[0] for result in results]
         return results
 
+    def search_by_texts(
+        self,
+        query_texts: List[str],
+        k: int,
+        distance_measure: Callable = cosine_similarity,
+        return_as_text: bool = False,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        **search_params,
+    ) -> List[List[Tuple[str, float, Dict[str, Any]]]]:
+        """Search by many texts, embedding all of them in a single request."""
+        if not query_texts:
+            return []
+        query_vectors = self.embedding_model.get_embeddings(list(query_texts))
+        results = self.search_many(query_vectors, k, distance_measure, metadata_filter, **search_params)
+
+        if return_as_text:
+            return [[result[0] for result in query_results] for query_results in results]
+        return results
+
+    def search_bm25(
+        self,
+        query_text: str,
+        k: int,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """Keyword search of the keys (chunk texts) ranked by BM25; needs ``bm25=True`` or :meth:`build_bm25`."""
+        snapshot = self._snapshot
+        if snapshot.bm25 is None:
+            raise ValueError("No BM25 index is attached; create the database with bm25=True or call build_bm25()")
+        if snapshot.size == 0 or k <= 0:
+            return []
+        rows = self._filter_rows(snapshot, metadata_filter)
+        if rows is not None and rows.size == 0:
+            return []
+        rows, scores = snapshot.bm25.score(query_text, snapshot.size, rows)
+        return self._collect_results(snapshot, scores, k, rows)
+
+    def hybrid_search(
+        self,
+        query_text: str,
+        k: int,
+        fusion: str = "rrf",
+        alpha: float = 0.5,
+        n_candidates: Optional[int] = None,
+        rrf_k: int = 60,
+        distance_measure: Callable = cosine_similarity,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        query_vector: Optional[np.ndarray] = None,
+        **search_params,
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """
+        Combine dense and BM25 retrieval so exact terms (names, form numbers) are not missed.
+
+        Both retrievers return ``n_candidates`` results (default ``max(4 * k, 50)``),
+        which are fused and cut to ``k``.
+
+        :param fusion: "rrf" (reciprocal-rank fusion, scale-free) or "weighted"
+            (min-max normalised scores mixed as ``alpha * dense + (1 - alpha) * bm25``)
+        :param alpha: Weight of the dense side; for "rrf" it weights the two rank terms
+        :param rrf_k: Rank offset of reciprocal-rank fusion
+        :param query_vector: Precomputed query embedding, skipping the embedding call
+        """
+        if query_vector is None:
+            query_vector = self.embedding_model.get_embedding(query_text)
+        return self._hybrid(
+            query_text, query_vector, k, fusion, alpha, n_candidates, rrf_k, distance_measure, metadata_filter,
+            **search_params,
+        )
+
+    async def ahybrid_search(
+        self,
+        query_text: str,
+        k: int,
+        fusion: str = "rrf",
+        alpha: float = 0.5,
+        n_candidates: Optional[int] = None,
+        rrf_k: int = 60,
+        distance_measure: Callable = cosine_similarity,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        query_vector: Optional[np.ndarray] = None,
+        **search_params,
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """Async :meth:`hybrid_search`, embedding the query with the async client."""
+        if query_vector is None:
+            query_vector = await self.embedding_model.async_get_embedding(query_text)
+        return await self._run_search(
+            self._hybrid, query_text, query_vector, k, fusion, alpha, n_candidates, rrf_k, distance_measure,
+            metadata_filter, **search_params,
+        )
+
+    def _hybrid(
+        self,
+        query_text: str,
+        query_vector: np.ndarray,
+        k: int,
+        fusion: str,
+        alpha: float,
+        n_candidates: Optional[int],
+        rrf_k: int,
+        distance_measure: Callable,
+        metadata_filter: Optional[Dict[str, Any]],
+        **search_params,
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        if fusion not in ("rrf", "weighted"):
+            raise ValueError(f"Unknown fusion: {fusion}. Available: ['rrf', 'weighted']")
+        n_candidates = max(k, n_candidates or max(4 * k, 50))
+        dense = self.search(query_vector, n_candidates, distance_measure, metadata_filter, **search_params)
+        sparse = self.search_bm25(query_text, n_candidates, metadata_filter)
+        return _fuse_results([dense, sparse], [alpha, 1.0 - alpha], k, fusion, rrf_k)
+
+    # Searches over fewer stored float32 elements than this finish in well under a
+    # millisecond, so the async variants run them inline rather than paying a thread hop.
+    _INLINE_SEARCH_ELEMENTS = 1 << 18
+
+    async def _run_search(self, search: Callable, *args, **kwargs) -> Any:
+        """Run ``search`` inline for small stores, otherwise on the event loop's default executor."""
+        snapshot = self._snapshot
+        if snapshot.size * (self._dim or 0) < self._INLINE_SEARCH_ELEMENTS:
+            return search(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(search, *args, **kwargs))
+
+    async def asearch(
+        self,
+        query_vector: np.array,
+        k: int,
+        distance_measure: Callable = cosine_similarity,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        exact: bool = False,
+        **search_params,
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """
+        Async :meth:`search` that never blocks the event loop on scoring.
+
+        Large searches run on the loop's default executor; this is safe alongside
+        concurrent writes because searches read a published snapshot without locking.
+        """
+        return await self._run_search(
+            self.search, query_vector, k, distance_measure, metadata_filter, exact, **search_params
+        )
+
+    async def asearch_by_text(
+        self,
+        query_text: str,
+        k: int,
+        distance_measure: Callable = cosine_similarity,
+        return_as_text: bool = False,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        **search_params,
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """Async :meth:`search_by_text`, embedding the query with the async client."""
+        query_vector = await self.embedding_model.async_get_embedding(query_text)
+        results = await self.asearch(query_vector, k, distance_measure, metadata_filter, **search_params)
+
+        if return_as_text:
+            return [result[0] for result in results]
+        return results
+
+    async def asearch_by_texts(
+        self,
+        query_texts: List[str],
+        k: int,
+        distance_measure: Callable = cosine_similarity,
+        return_as_text: bool = False,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        **search_params,
+    ) -> List[List[Tuple[str, float, Dict[str, Any]]]]:
+        """Async :meth:`search_by_texts`, embedding the queries with the async client."""
+        if not query_texts:
+            return []
+        query_vectors = await self.embedding_model.async_get_embeddings(list(query_texts))
+        results = await self._run_search(
+            self.search_many, query_vectors, k, distance_measure, metadata_filter, **search_params
+        )
+
+        if return_as_text:
+            return [[result[0] for result in query_results] for query_results in results]
+        return results
+
     def search_by_distance_metric(
         self,
         query_text: str,
         k: int,
         metric_name: str = "cosine",
         metadata_filter: Optional[Dict[str, Any]] = None,
+        **search_params,
     ) -> List[Tuple[str, float, Dict[str, Any]]]:
         """Search using a named distance metric."""
         if metric_name not in DISTANCE_METRICS:
             raise ValueError(f"Unknown distance metric: {metric_name}. Available: {list(DISTANCE_METRICS.keys())}")
         
         distance_func = DISTANCE_METRICS[metric_name]
-        return self.search_by_text(query_text, k, distance_func, metadata_filter=metadata_filter)
+        return self.search_by_text(query_text, k, distance_func, metadata_filter=metadata_filter, **search_params)
+
+    def quantization_report(
+        self,
+        query_vectors: np.ndarray,
+        k: int = 10,
+        distance_measure: Callable = cosine_similarity,
+    ) -> Dict[str, Any]:
+        """
+        Report the memory/recall trade-off of the attached quantizer.
+
+        Recall@k is measured against exact search for the given queries, both for the
+        raw quantized scores and after float32 re-scoring.
+        """
+        snapshot = self._snapshot
+        if snapshot.quantizer is None or not snapshot.quantizer.is_ready:
+            raise ValueError("No trained quantizer is attached to this database")
+
+        approximate_hits = rescored_hits = 0
+        for query in np.asarray(query_vectors, dtype=np.float32):
+            truth = {key for key, _, _ in self.search(query, k, distance_measure, exact=True)}
+            approximate = self.search(query, k, distance_measure, rescore_factor=0)
+            rescored = self.search(query, k, distance_measure, rescore_factor=max(1, self.rescore_factor))
+            approximate_hits += len(truth.intersection(key for key, _, _ in approximate))
+            rescored_hits += len(truth.intersection(key for key, _, _ in rescored))
+
+        total = max(1, len(query_vectors) * min(k, len(self)))
+        float_bytes = snapshot.size * self._dim * 4
+        code_bytes = snapshot.quantizer.memory_bytes(snapshot.size)
+        return {
+            "quantization": snapshot.quantizer.name,
+            "vectors": len(self),
+            "float32_bytes": float_bytes,
+            "code_bytes": code_bytes,
+            "compression_ratio": float_bytes / max(1, code_bytes),
+            "recall_at_k": approximate_hits / total,
+            "rescored_recall_at_k": rescored_hits / total,
+            "rescore_factor": max(1, self.rescore_factor),
+            "k": k,
+        }
+
+    def stats(self, metadata_filter: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Size, memory and configuration of the store, as of one snapshot.
+
+        ``bytes`` breaks the footprint down by component (vectors, key texts, metadata
+        columns, lookup structures, index, quantizer, BM25); structure sizes are
+        estimated by walking their arrays and containers, so this is not for hot paths.
+
+        :param metadata_filter: Optional filter whose match count and selectivity (the
+            fraction of live vectors it keeps) are reported
+        """
+        snapshot = self._snapshot
+        size = snapshot.size
+        n_vectors = size - snapshot.n_deleted
+        components = {
+            "vectors": snapshot.matrix[:size].nbytes if snapshot.matrix is not None else 0,
+            "norms": snapshot.norms[:size].nbytes if snapshot.norms is not None else 0,
+            "tombstones": size,
+            "ids": snapshot.ids[:size].nbytes,
+            "texts": snapshot.texts.memory_bytes(),
+            "metadata": snapshot.columns.memory_bytes(),
+            "key_index": _nbytes(snapshot.key_index),
+            "metadata_index": _nbytes(snapshot.metadata_index),
+            "index": _nbytes(snapshot.index) if snapshot.index is not None else 0,
+            "quantizer": _nbytes(snapshot.quantizer) if snapshot.quantizer is not None else 0,
+            "bm25": _nbytes(snapshot.bm25) if snapshot.bm25 is not None else 0,
+        }
+        total = sum(components.values())
+        stats = {
+            "n_vectors": n_vectors,
+            "n_rows": size,
+            "n_deleted": snapshot.n_deleted,
+            "dim": self._dim,
+            "capacity": snapshot.matrix.shape[0] if snapshot.matrix is not None else 0,
+            "index": snapshot.index.name if snapshot.index is not None else "exact",
+            "index_ready": snapshot.index is not None and snapshot.index.is_ready,
+            "quantization": snapshot.quantizer.name if snapshot.quantizer is not None else "none",
+            "bm25": snapshot.bm25 is not None,
+            "metadata_fields": snapshot.columns.fields(),
+            "bytes": {**components, "total": total},
+            "bytes_per_vector": total / n_vectors if n_vectors else 0.0,
+        }
+        if metadata_filter:
+            rows = self._filter_rows(snapshot, metadata_filter)
+            if rows.size and snapshot.n_deleted:
+                rows = rows[~snapshot.deleted[rows]]
+            stats["filter_matches"] = int(rows.shape[0])
+            stats["filter_selectivity"] = rows.shape[0] / n_vectors if n_vectors else 0.0
+        return stats
 
     def retrieve_from_key(self, key: str) -> Tuple[np.array, Dict[str, Any]]:
         """Retrieve vector and metadata for a given key."""
-        vector = self.vectors.get(key, None)
-        metadata = self.metadata.get(key, {})
+        vector, metadata = self._lookup(key)
         return vector, metadata
 
+    def get_id(self, key: str) -> Optional[int]:
+        """The integer document id currently stored under ``key``, or None."""
+        snapshot = self._snapshot
+        row = snapshot.key_index.get(key, snapshot.texts)
+        if row is None or row >= snapshot.size:
+            return None
+        return int(snapshot.ids[row])
+
+    def retrieve_by_id(self, doc_id: int) -> Tuple[Optional[str], Optional[np.ndarray], Dict[str, Any]]:
+        """
+        Retrieve the key, vector and metadata of a document id.
+
+        Ids increase with the row they were written to and compaction keeps row order,
+        so the row is found by binary search. Returns ``(None, None, {})`` for ids that
+        were deleted or replaced by a later write of the same key.
+        """
+        snapshot = self._snapshot
+        ids = snapshot.ids[: snapshot.size]
+        row = int(np.searchsorted(ids, doc_id))
+        if row >= snapshot.size or ids[row] != doc_id or snapshot.deleted[row]:
+            return None, None, {}
+        vector = snapshot.matrix[row] * snapshot.norms[row]
+        return snapshot.texts.get(row), vector, snapshot.columns.get(row) or {}
+
     def get_all_metadata(self) -> Dict[str, Dict[str, Any]]:
         """Get all metadata in the database."""
         return dict(self.metadata)
 
     def filter_by_metadata(self, filter_criteria: Dict[str, Any]) -> List[str]:
         """Get all keys that match the metadata filter."""
-        matching_keys = []
-        for key, metadata in self.metadata.items():
-            if self._matches_filter(metadata, filter_criteria):
-                matching_keys.append(key)
-        return matching_keys
+        if not filter_criteria:
+            return list(self.metadata.keys())
+        snapshot = self._snapshot
+        rows = self._filter_rows(snapshot, filter_criteria)
+        if rows.size and snapshot.n_deleted:
+            rows = rows[~snapshot.deleted[rows]]
+        return [snapshot.texts.get(row) for row in rows.tolist()]
+
+    def save(self, path: str) -> None:
+        """
+        Save the database to the directory ``path``.
+
+        Vectors and norms are written as raw ``.npy`` files so they can be memory-mapped
+        on load; keys (``null`` for tombstoned rows) and metadata go to a compact JSON
+        side file, and any index or quantizer is pickled alongside. Files are replaced
+        atomically, so saving over a database that is currently memory-mapped from
+        ``path`` is safe. Writers are paused while saving; searches are not.
+        """
+        with self._write_lock:
+            self._save(path)
+
+    def _save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        if self._dim is None:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+            norms = np.zeros(0, dtype=np.float32)
+        else:
+            matrix, norms = self._stored(self._snapshot)
+
+        records = {
+            "format_version": 1,
+            "dim": self._dim,
+            "size": self._size,
+            "rescore_factor": self.rescore_factor,
+            "keys": [None if self._deleted[row] else self._texts.get(row) for row in range(self._size)],
+            "metadata": [None if self._deleted[row] else self._columns.get(row) for row in range(self._size)],
+            "ids": self._ids[: self._size].tolist(),
+            "next_id": self._next_id,
+        }
+        _atomic_write(os.path.join(path, "vectors.npy"), lambda f: np.save(f, matrix))
+        _atomic_write(os.path.join(path, "norms.npy"), lambda f: np.save(f, norms))
+        _atomic_write(
+            os.path.join(path, "records.json"),
+            lambda f: f.write(json.dumps(records, separators=(",", ":")).encode("utf-8")),
+        )
+        for name, structure in (("index.pkl", self._index), ("quantizer.pkl", self._quantizer), ("bm25.pkl", self._bm25)):
+            file_path = os.path.join(path, name)
+            if structure is not None:
+                _atomic_write(file_path, lambda f: pickle.dump(structure, f, protocol=pickle.HIGHEST_PROTOCOL))
+            elif os.path.exists(file_path):
+                os.remove(file_path)
+
+    @classmethod
+    def load(cls, path: str, embedding_model: EmbeddingModel = None, mmap: bool = True) -> "VectorDatabase":
+        """
+        Load a database written by :meth:`save`.
+
+        With ``mmap=True`` the vector matrix is memory-mapped copy-on-write, so opening a
+        large store is instant and pages are read lazily as searches touch them. The first
+        insert that needs more rows copies the matrix into memory.
+        """
+        with open(os.path.join(path, "records.json"), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        if records.get("format_version") != 1:
+            raise ValueError(f"Unsupported VectorDatabase format: {records.get('format_version')}")
+
+        db = cls(embedding_model, rescore_factor=records["rescore_factor"])
+        if records["dim"] is not None:
+            mmap_mode = "c" if mmap else None
+            db._dim = records["dim"]
+            db._matrix = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mmap_mode)
+            db._norms = np.load(os.path.join(path, "norms.npy"), mmap_mode=mmap_mode)
+            db._deleted = np.array([key is None for key in records["keys"]], dtype=bool)
+            db._n_deleted = int(db._deleted.sum())
+        db._size = records["size"]
+        keys = records["keys"]
+        # Tombstoned rows keep an empty text so rows stay aligned with the stored vectors.
+        db._texts.append_many([key or "" for key in keys])
+        db._columns.append_many([item_metadata or None for item_metadata in records["metadata"]])
+        for row, (key, item_metadata) in enumerate(zip(keys, records["metadata"])):
+            if key is None:
+                continue
+            db._key_index.set(key, row, db._texts)
+            if item_metadata:
+                db._metadata_index.add(row, item_metadata)
+        # Stores saved before document ids existed number their rows in order.
+        db._ids = np.asarray(records.get("ids", range(len(keys))), dtype=np.int64)
+        db._next_id = records.get("next_id", len(keys))
+
+        for name, attribute in (("index.pkl", "_index"), ("quantizer.pkl", "_quantizer"), ("bm25.pkl", "_bm25")):
+            file_path = os.path.join(path, name)
+            if os.path.exists(file_path):
+                with open(file_path, "rb") as f:
+                    setattr(db, attribute, pickle.load(f))
+        db._publish()
+        return db
+
+    @classmethod
+    def open(
+        cls,
+        path: str,
+        embedding_model: EmbeddingModel = None,
+        sync_every: int = 64,
+        sync_interval: float = 1.0,
+        checkpoint_bytes: int = 64 * 1024 * 1024,
+        mmap: bool = True,
+        **kwargs,
+    ) -> "VectorDatabase":
+        """
+        Open (or create) a durable database in the directory ``path``.
+
+        The directory holds the last checkpoint (a :meth:`save` snapshot) and a
+        write-ahead log of every insert, upsert and delete since. Opening loads the
+        checkpoint and replays the log over it; afterwards each write appends to the
+        log before it is applied, so ingest costs I/O proportional to the change. Once
+        the log exceeds ``checkpoint_bytes`` a new checkpoint is written and the log
+        is emptied.
+
+        :param sync_every: Log appends per fsync; a crash of the machine (not just the
+            process) may lose up to this many acknowledged writes. 1 syncs every write.
+        :param sync_interval: Maximum seconds a logged write waits for its fsync, even when no
+            further writes arrive
+        :param checkpoint_bytes: Log size that triggers an automatic checkpoint
+        :param mmap: Memory-map the checkpoint's vectors (see :meth:`load`)
+        :param kwargs: Constructor arguments used when the directory holds no checkpoint yet
+        """
+        os.makedirs(path, exist_ok=True)
+        checkpoint_path = os.path.join(path, "CHECKPOINT")
+        sequence = 0
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            db = cls.load(os.path.join(path, checkpoint["snapshot"]), embedding_model, mmap=mmap)
+            sequence = checkpoint["sequence"]
+        else:
+            db = cls(embedding_model, **kwargs)
+
+        wal = WriteAheadLog(os.path.join(path, "wal.log"), sync_every=sync_every, sync_interval=sync_interval)
+        for record in wal.replay(after=sequence):
+            db._apply(record)
+        # An empty log after a checkpoint must continue the checkpoint's numbering.
+        wal.last_sequence = max(wal.last_sequence, sequence)
+        db._wal, db._wal_directory, db.checkpoint_bytes = wal, path, checkpoint_bytes
+        return db
+
+    def _apply(self, record: LogRecord) -> None:
+        """Re-apply one logged write during recovery."""
+        if record.op == "write":
+            self._write(record.keys, record.vectors, record.metadata, record.keep_metadata)
+        elif record.op == "delete":
+            with self._write_lock:
+                for key in record.keys:
+                    self._tombstone(key)
+                self._publish()
+        else:
+            raise ValueError(f"Unknown write-ahead log operation: {record.op}")
+
+    def checkpoint(self) -> None:
+        """
+        Write a snapshot of a database opened with :meth:`open` and empty its log.
+
+        The snapshot goes to a new directory and becomes current through an atomic
+        rename of the ``CHECKPOINT`` pointer, so a crash at any point leaves either the
+        old checkpoint plus the full log or the new one. Log records already covered
+        by the pointed-to snapshot are skipped on replay.
+        """
+        if self._wal is None:
+            raise ValueError("checkpoint() requires a database opened with VectorDatabase.open()")
+        with self._write_lock:
+            self._wal.sync()
+            sequence = self._wal.last_sequence
+            snapshot = f"snapshot-{sequence:012d}"
+            self._save(os.path.join(self._wal_directory, snapshot))
+            pointer = json.dumps({"snapshot": snapshot, "sequence": sequence})
+            _atomic_write(os.path.join(self._wal_directory, "CHECKPOINT"), lambda f: f.write(pointer.encode("utf-8")))
+            self._wal.reset()
+            for name in os.listdir(self._wal_directory):
+                if name.startswith("snapshot-") and name != snapshot:
+                    # Already-open memory maps of the old files stay valid on POSIX.
+                    shutil.rmtree(os.path.join(self._wal_directory, name), ignore_errors=True)
+
+    def _maybe_checkpoint(self) -> None:
+        if self._wal is not None and self._wal.size >= self.checkpoint_bytes:
+            self.checkpoint()
+
+    def close(self) -> None:
+        """Flush the write-ahead log of a database opened with :meth:`open` to disk and close it."""
+        with self._write_lock:
+            if self._wal is not None:
+                self._wal.close()
+                self._wal = None
+
+    async def _aembed_documents(self, texts: List[str]) -> np.ndarray:
+        """Embed document chunks as one float32 array, through the model's document store when it has one."""
+        model = self.embedding_model
+        if hasattr(model, "async_get_embeddings_array"):
+            return await model.async_get_embeddings_array(texts)
+        # Custom models only need to implement async_get_embeddings.
+        return np.asarray(await model.async_get_embeddings(texts), dtype=np.float32)
 
     async def abuild_from_list(self, list_of_text: List[str]) -> "VectorDatabase":
         """Build database from list of texts (legacy method)."""
-        embeddings = await self.embedding_model.async_get_embeddings(list_of_text)
-        for text, embedding in zip(list_of_text, embeddings):
-            self.insert(text, np.array(embedding))
+        embeddings = await self._aembed_documents(list_of_text)
+        self.insert_many(list_of_text, embeddings)
         return self
 
     async def abuild_from_list_with_metadata(
         self, 
-        texts_with_metadata: List[Tuple[str, Dict[str, Any]]]
+        texts_with_metadata: List[Tuple[str, Dict[str, Any]]],
+        deduplicate: Union[bool, MinHashDeduplicator] = False,
+        dedup_mode: str = "drop",
     ) -> "VectorDatabase":
-        """Build database from list of texts with metadata."""
+        """
+        Build database from list of texts with metadata.
+
+        :param deduplicate: Drop near-duplicate chunks (repeated headers, footers,
+            boilerplate pages) before embedding them; True or a configured
+            MinHashDeduplicator. The savings are left in ``last_dedup_report``.
+        :param dedup_mode: "drop" or "merge" (see :meth:`MinHashDeduplicator.deduplicate`)
+        """
+        report = None
+        if deduplicate:
+            deduplicator = deduplicate if isinstance(deduplicate, MinHashDeduplicator) else MinHashDeduplicator()
+            model = self.embedding_model
+            texts_with_metadata, report = deduplicator.deduplicate(
+                texts_with_metadata,
+                mode=dedup_mode,
+                scheduler=getattr(model, "scheduler", None),
+                model_name=getattr(model, "embeddings_model_name", "text-embedding-3-small"),
+            )
         texts = [text for text, _ in texts_with_metadata]
-        embeddings = await self.embedding_model.async_get_embeddings(texts)
-        
-        for (text, metadata), embedding in zip(texts_with_metadata, embeddings):
-            self.insert(text, np.array(embedding), metadata)
+        embeddings = await self._aembed_documents(texts)
+        metadata = [item_metadata for _, item_metadata in texts_with_metadata]
+        self.insert_many(texts, embeddings, metadata)
+        if report is not None:
+            report.vector_bytes_saved = report.n_duplicates * (self._dim or 0) * 4
+            self.last_dedup_report = report
         return self
 
 
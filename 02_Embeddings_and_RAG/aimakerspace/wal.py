@@ -0,0 +1,194 @@
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+_MAGIC = b"AIMWAL1\n"
+# Every record is framed as (payload length, crc32 of payload) followed by the payload,
+# which is a length-prefixed JSON header and then the raw float32 vectors.
+_FRAME = struct.Struct("<II")
+_HEADER_LENGTH = struct.Struct("<I")
+
+
+class LogRecord(NamedTuple):
+    """One logged change: a batch write (insert/upsert) or a batch delete."""
+
+    sequence: int
+    op: str
+    keys: List[str]
+    vectors: Optional[np.ndarray]
+    metadata: Optional[List[Optional[Dict[str, Any]]]]
+    keep_metadata: bool
+
+
+class WriteAheadLog:
+    """
+    Append-only, checksummed log of VectorDatabase writes with group commit.
+
+    Each record is handed to the OS as soon as it is appended, so a crash of the
+    process loses nothing; ``fsync`` (which protects against power loss) is issued
+    once ``sync_every`` records have accumulated, and a background timer syncs any
+    record still pending ``sync_interval`` seconds after it was appended. A torn
+    record at the end of the file, left by a crash mid-append, is detected by its
+    checksum and discarded on open.
+    """
+
+    def __init__(self, path: str, sync_every: int = 64, sync_interval: float = 1.0):
+        """
+        :param path: Log file, created if missing
+        :param sync_every: Appends between fsyncs (1 makes every write durable on return)
+        :param sync_interval: Maximum seconds an appended record waits for its fsync,
+            whether or not more records follow
+        """
+        self.path = path
+        self.sync_every = max(1, sync_every)
+        self.sync_interval = sync_interval
+        self.last_sequence = 0
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+        valid_bytes = self._scan()
+        self._file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        if valid_bytes == 0:
+            self._file.write(_MAGIC)
+            valid_bytes = len(_MAGIC)
+        self._file.truncate(valid_bytes)
+        self._file.seek(valid_bytes)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _scan(self) -> int:
+        """Find the last sequence number and the length of the intact prefix of the log."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return 0
+        with open(self.path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{self.path} is not a VectorDatabase write-ahead log")
+        valid_bytes = len(_MAGIC)
+        for record, end in self._read(self.path):
+            self.last_sequence = record.sequence
+            valid_bytes = end
+        return valid_bytes
+
+    @staticmethod
+    def _read(path: str) -> Iterator[tuple]:
+        with open(path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                return
+            offset = len(_MAGIC)
+            while True:
+                frame = f.read(_FRAME.size)
+                if len(frame) < _FRAME.size:
+                    return
+                length, checksum = _FRAME.unpack(frame)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    return
+                offset += _FRAME.size + length
+                yield _decode(payload), offset
+
+    def replay(self, after: int = 0) -> Iterator[LogRecord]:
+        """Yield the intact records with a sequence number above ``after``, in order."""
+        self._file.flush()
+        for record, _ in self._read(self.path):
+            if record.sequence > after:
+                yield record
+
+    def append(
+        self,
+        op: str,
+        keys: List[str],
+        vectors: Optional[np.ndarray] = None,
+        metadata: Optional[List[Optional[Dict[str, Any]]]] = None,
+        keep_metadata: bool = True,
+    ) -> int:
+        """Append one record and return its sequence number."""
+        header = {"sequence": self.last_sequence + 1, "op": op, "keys": list(keys)}
+        vector_bytes = b""
+        if vectors is not None:
+            vectors = np.ascontiguousarray(vectors, dtype="<f4")
+            header["dim"] = int(vectors.shape[1])
+            vector_bytes = vectors.tobytes()
+        if metadata is not None:
+            header["metadata"] = list(metadata)
+            header["keep_metadata"] = keep_metadata
+        encoded = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        payload = _HEADER_LENGTH.pack(len(encoded)) + encoded + vector_bytes
+
+        with self._lock:
+            self._file.write(_FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._file.flush()
+            self.last_sequence += 1
+            self._pending += 1
+            if self._pending >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync()
+            elif self._timer is None:
+                # The end of a burst gets no later append to sync it, so a timer does.
+                self._timer = threading.Timer(self.sync_interval, self._sync_pending)
+                self._timer.daemon = True
+                self._timer.start()
+            return self.last_sequence
+
+    def _sync(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def _sync_pending(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+
+    def sync(self) -> None:
+        """Force every appended record to stable storage."""
+        with self._lock:
+            self._sync()
+
+    @property
+    def size(self) -> int:
+        """Current length of the log file in bytes."""
+        return self._file.tell()
+
+    def reset(self) -> None:
+        """Drop every record (after a checkpoint made them redundant), keeping the sequence."""
+        with self._lock:
+            self._file.seek(0)
+            self._file.truncate()
+            self._file.write(_MAGIC)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+
+def _decode(payload: bytes) -> LogRecord:
+    (header_length,) = _HEADER_LENGTH.unpack_from(payload)
+    start = _HEADER_LENGTH.size
+    header = json.loads(payload[start : start + header_length].decode("utf-8"))
+    vectors = None
+    if "dim" in header:
+        vectors = np.frombuffer(payload, dtype="<f4", offset=start + header_length).reshape(-1, header["dim"])
+    return LogRecord(
+        header["sequence"],
+        header["op"],
+        header["keys"],
+        vectors,
+        header.get("metadata"),
+        header.get("keep_metadata", True),
+    )
@@ -0,0 +1,375 @@
+import asyncio
+import email.utils
+import functools
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+import openai
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken is optional
+    tiktoken = None
+
+T = TypeVar("T")
+
+# OpenAI embedding endpoint limits: inputs per request, tokens per request and per input.
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_REQUEST = 300_000
+MAX_TOKENS_PER_INPUT = 8192
+
+
+@functools.lru_cache(maxsize=None)
+def token_counter(model_name: str) -> Tuple[Callable[[List[str]], List[int]], bool]:
+    """
+    Return ``(count, exact)`` where ``count`` maps texts to their token counts for ``model_name``.
+
+    Uses tiktoken when it is installed and its encoding can be loaded; otherwise the
+    UTF-8 byte length is used, which never undercounts, and ``exact`` is False.
+    """
+    if tiktoken is not None:
+        try:
+            try:
+                encoding = tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:  # the encoding files could not be fetched (e.g. offline)
+            encoding = None
+        if encoding is not None:
+            return (lambda texts: [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]), True
+    return (lambda texts: [len(text.encode("utf-8")) for text in texts]), False
+
+
+def pack_batches(
+    token_counts: Sequence[int],
+    max_tokens: int = MAX_TOKENS_PER_REQUEST,
+    max_inputs: int = MAX_INPUTS_PER_REQUEST,
+) -> List[Tuple[int, int]]:
+    """
+    Greedily cut consecutive inputs into ``(start, stop)`` batches under both request limits.
+
+    An input larger than ``max_tokens`` on its own still gets a batch of its own.
+    """
+    batches = []
+    start, tokens = 0, 0
+    for i, count in enumerate(token_counts):
+        if i > start and (tokens + count > max_tokens or i - start >= max_inputs):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += count
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
+
+
+class RetryPolicy:
+    """
+    When and how long to retry a failed embedding request, and when to split it instead.
+
+    Rate limits (429), server errors (5xx), conflicts, timeouts and connection errors are
+    retried with full-jitter exponential backoff, waiting at least as long as the
+    response's Retry-After header asks. Oversized requests (413), bad requests that
+    blame an input (e.g. one over the context length) and timeouts of multi-input
+    batches are split in half instead, which isolates a poison input and shrinks
+    oversized requests; a single input that is rejected outright is given up on.
+    Other bad requests (an unsupported ``dimensions``, say) would fail for every
+    input alike, so they fail the batch at once without splitting.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 6,
+        base_delay: float = 0.5,
+        max_delay: float = 60.0,
+        split_failed_batches: bool = True,
+    ):
+        """
+        :param max_retries: Retries of one request before its inputs are reported as failed
+        :param base_delay: Backoff ceiling (seconds) of the first retry; it doubles per retry
+        :param max_delay: Upper bound on the backoff ceiling
+        :param split_failed_batches: Split oversized, input-rejecting and timed-out batches in half and retry the halves
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.split_failed_batches = split_failed_batches
+
+    @staticmethod
+    def _status(error: BaseException) -> Optional[int]:
+        return getattr(error, "status_code", None)
+
+    def is_timeout(self, error: BaseException) -> bool:
+        return isinstance(error, (openai.APITimeoutError, asyncio.TimeoutError)) or self._status(error) == 408
+
+    def is_retryable(self, error: BaseException) -> bool:
+        if isinstance(error, openai.APIConnectionError) or self.is_timeout(error):
+            return True
+        status = self._status(error)
+        return status is not None and (status in (409, 429) or status >= 500)
+
+    # Phrases of 400 responses that reject one input rather than the request as a whole.
+    _INPUT_ERROR_PHRASES = ("context length", "input", "too many tokens", "too long")
+
+    def is_input_error(self, error: BaseException) -> bool:
+        """Whether a bad request blames one of the inputs (so a smaller batch may succeed)."""
+        if self._status(error) != 400:
+            return False
+        param = getattr(error, "param", None) or ""
+        message = str(getattr(error, "message", None) or error).lower()
+        return param.startswith("input") or any(phrase in message for phrase in self._INPUT_ERROR_PHRASES)
+
+    def should_split(self, error: BaseException) -> bool:
+        return self.split_failed_batches and (
+            self._status(error) == 413 or self.is_input_error(error) or self.is_timeout(error)
+        )
+
+    @staticmethod
+    def retry_after(error: BaseException) -> Optional[float]:
+        """Seconds the server asked to wait (``retry-after-ms`` or ``retry-after``), if it said."""
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        if not headers:
+            return None
+        value = headers.get("retry-after-ms")
+        if value is not None:
+            try:
+                return max(0.0, float(value) / 1000.0)
+            except ValueError:
+                pass
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            # The header may also be an HTTP date.
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def delay(self, attempt: int, error: BaseException) -> float:
+        """Seconds to wait before retry number ``attempt`` (0-based) after ``error``."""
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            # Jitter on top of the server's wait so that paused requests do not all resume at once.
+            return retry_after + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class EmbeddingBatchError(RuntimeError):
+    """
+    Raised when some inputs could not be embedded after retries and splitting.
+
+    Every other input was still embedded: ``results`` holds one result per input, with
+    None where embedding failed, and ``failures`` lists the failed ``(start, stop, error)``
+    input ranges.
+    """
+
+    def __init__(self, results: List, failures: List[Tuple[int, int, BaseException]]):
+        self.results = results
+        self.failures = sorted(failures, key=lambda failure: failure[0])
+        n_failed = sum(stop - start for start, stop, _ in self.failures)
+        super().__init__(
+            f"{n_failed} of {len(results)} inputs could not be embedded; first error: {self.failures[0][2]!r}"
+        )
+
+    @property
+    def failed_indices(self) -> List[int]:
+        return [i for start, stop, _ in self.failures for i in range(start, stop)]
+
+
+class RateLimiter:
+    """
+    Async token-bucket pacing against requests-per-minute and tokens-per-minute budgets.
+
+    Each budget refills continuously at ``budget / 60`` per second up to one minute's
+    worth, so bursts are allowed up to the budget and sustained throughput converges
+    on it. Waiters are served in arrival order. A budget of None is unlimited.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._paused_until = 0.0
+        self.waited = 0.0
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request for ``seconds``, e.g. after the server answered with Retry-After."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed, self._updated = now - self._updated, now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60.0)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60.0)
+
+    def _delay(self, tokens: float) -> float:
+        """Seconds until one request of ``tokens`` fits both budgets (0 if it fits now)."""
+        delay = 0.0
+        if self.requests_per_minute and self._requests < 1:
+            delay = max(delay, (1 - self._requests) * 60.0 / self.requests_per_minute)
+        if self.tokens_per_minute and self._tokens < tokens:
+            delay = max(delay, (tokens - self._tokens) * 60.0 / self.tokens_per_minute)
+        return delay
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait out any pause and until a request of ``tokens`` tokens fits the budgets, then spend them."""
+        while True:
+            paused = self._paused_until - time.monotonic()
+            if paused <= 0:
+                break
+            self.waited += paused
+            await asyncio.sleep(paused)
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return
+        if self.tokens_per_minute:
+            # A request larger than a whole minute's budget waits for a full bucket instead of forever.
+            tokens = min(tokens, self.tokens_per_minute)
+        loop = asyncio.get_running_loop()
+        if self._lock_loop is not loop:
+            # asyncio locks belong to one event loop; each asyncio.run() gets a fresh one.
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        async with self._lock:
+            while True:
+                self._refill()
+                delay = self._delay(tokens)
+                if delay <= 0:
+                    break
+                self.waited += delay
+                await asyncio.sleep(delay)
+            if self.requests_per_minute:
+                self._requests -= 1
+            if self.tokens_per_minute:
+                self._tokens -= tokens
+
+
+class EmbeddingBatchScheduler:
+    """
+    Token-aware batching with bounded concurrency and rate pacing for embedding requests.
+
+    Inputs are packed in order into requests under the per-request token and input
+    limits, at most ``max_concurrency`` requests are in flight, and each request waits
+    for the requests-per-minute / tokens-per-minute budgets before it is sent. Failed
+    requests are retried or split according to ``retry`` without holding up the others,
+    and inputs that still fail are reported by :class:`EmbeddingBatchError` together with
+    every result that succeeded.
+    """
+
+    def __init__(
+        self,
+        max_tokens_per_request: int = MAX_TOKENS_PER_REQUEST,
+        max_inputs_per_request: int = MAX_INPUTS_PER_REQUEST,
+        max_concurrency: int = 8,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        retry: Optional[RetryPolicy] = None,
+    ):
+        """
+        :param max_tokens_per_request: Token cap of one request (summed over its inputs)
+        :param max_inputs_per_request: Input cap of one request
+        :param max_concurrency: Requests allowed in flight at once
+        :param requests_per_minute: Optional RPM budget to pace against
+        :param tokens_per_minute: Optional TPM budget to pace against
+        :param retry: Retry and split policy for failed requests; defaults to :class:`RetryPolicy`
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_inputs_per_request = max_inputs_per_request
+        self.max_concurrency = max_concurrency
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.retry = retry or RetryPolicy()
+        self.requests = 0
+        self.tokens = 0
+        self.retries = 0
+        self.splits = 0
+        self.failed = 0
+
+    def plan(self, texts: List[str], model_name: str) -> Tuple[List[Tuple[int, int]], List[int]]:
+        """Cut ``texts`` into ``(start, stop)`` batches and return them with the token count of every input."""
+        count, exact = token_counter(model_name)
+        token_counts = count(texts) if texts else []
+        if exact:
+            for i, tokens in enumerate(token_counts):
+                if tokens > MAX_TOKENS_PER_INPUT:
+                    raise ValueError(
+                        f"Input {i} has {tokens} tokens; the embedding limit is {MAX_TOKENS_PER_INPUT} per input"
+                    )
+        return pack_batches(token_counts, self.max_tokens_per_request, self.max_inputs_per_request), token_counts
+
+    async def run(
+        self,
+        texts: List[str],
+        send: Callable[[List[str]], Awaitable[List[T]]],
+        model_name: str,
+    ) -> List[T]:
+        """
+        Embed ``texts`` by calling ``send`` once per planned batch, retrying and splitting failures.
+
+        :param send: Coroutine function embedding one batch, returning one result per input
+        :return: The results of every batch, flattened in input order
+        :raises EmbeddingBatchError: If some inputs still failed; it carries the other results
+        """
+        batches, token_counts = self.plan(texts, model_name)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results: List[Optional[T]] = [None] * len(texts)
+        failures: List[Tuple[int, int, BaseException]] = []
+
+        async def send_once(start: int, stop: int) -> List[T]:
+            tokens = sum(token_counts[start:stop])
+            async with semaphore:
+                await self.limiter.acquire(tokens)
+                self.requests += 1
+                self.tokens += tokens
+                return await send(texts[start:stop])
+
+        async def dispatch(start: int, stop: int) -> None:
+            attempt = 0
+            while True:
+                try:
+                    results[start:stop] = await send_once(start, stop)
+                    return
+                except Exception as exc:  # classified by the retry policy below
+                    error = exc
+                if stop - start > 1 and self.retry.should_split(error):
+                    self.splits += 1
+                    middle = (start + stop) // 2
+                    await asyncio.gather(dispatch(start, middle), dispatch(middle, stop))
+                    return
+                if not self.retry.is_retryable(error) or attempt >= self.retry.max_retries:
+                    self.failed += stop - start
+                    failures.append((start, stop, error))
+                    return
+                retry_after = self.retry.retry_after(error)
+                if retry_after:
+                    # The whole deployment is over its limit, not just this request.
+                    self.limiter.pause(retry_after)
+                self.retries += 1
+                # The semaphore is released while backing off, so other batches keep flowing.
+                await asyncio.sleep(self.retry.delay(attempt, error))
+                attempt += 1
+
+        await asyncio.gather(*[dispatch(start, stop) for start, stop in batches])
+        if failures:
+            raise EmbeddingBatchError(results, failures) from failures[0][2]
+        return results
+
+    def stats(self) -> Dict[str, float]:
+        """Requests and tokens sent so far, retries, splits, failed inputs and time spent waiting on the rate budgets."""
+        return {
+            "requests": self.requests,
+            "tokens": self.tokens,
+            "retries": self.retries,
+            "splits": self.splits,
+            "failed_inputs": self.failed,
+            "rate_limit_wait_s": self.limiter.waited,
+        }
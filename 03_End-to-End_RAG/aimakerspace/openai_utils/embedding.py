@@ -1,13 +1,24 @@
 from dotenv import load_dotenv
 from openai import AsyncOpenAI, OpenAI
 import openai
-from typing import List
+from typing import List, Optional
 import os
 import asyncio
 
+from aimakerspace.openai_utils.batching import EmbeddingBatchScheduler
+
 
 class EmbeddingModel:
-    def __init__(self, embeddings_model_name: str = "text-embedding-3-small"):
+    def __init__(
+        self,
+        embeddings_model_name: str = "text-embedding-3-small",
+        scheduler: Optional[EmbeddingBatchScheduler] = None,
+    ):
+        """
+        :param embeddings_model_name: OpenAI embedding model to call
+        :param scheduler: Batching, concurrency and rate pacing for ``async_get_embeddings``;
+            defaults to token-packed batches with at most 8 requests in flight
+        """
         load_dotenv()
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.async_client = AsyncOpenAI()
@@ -19,13 +30,17 @@ class EmbeddingModel:
             )
         openai.api_key = self.openai_api_key
         self.embeddings_model_name = embeddings_model_name
+        self.scheduler = scheduler or EmbeddingBatchScheduler()
 
     async def async_get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
-        embedding_response = await self.async_client.embeddings.create(
-            input=list_of_text, model=self.embeddings_model_name
-        )
+        async def process_batch(batch):
+            embedding_response = await self.async_client.embeddings.create(
+                input=batch, model=self.embeddings_model_name
+            )
+            return [embeddings.embedding for embeddings in embedding_response.data]
 
-        return [embeddings.embedding for embeddings in embedding_response.data]
+        # Batches are packed by token count and sent with bounded concurrency and pacing.
+        return await self.scheduler.run(list_of_text, process_batch, self.embeddings_model_name)
 
     async def async_get_embedding(self, text: str) -> List[float]:
         embedding = await self.async_client.embeddings.create(